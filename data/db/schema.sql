@@ -1,4 +1,4 @@
-CREATE TABLE "armigers" (
+CREATE TABLE IF NOT EXISTS "armigers" (
 	"greii_n" INTEGER NOT NULL PRIMARY KEY,
 	"discord_id" INTEGER UNIQUE,
 	"qualified_name" TEXT,
@@ -6,19 +6,40 @@ CREATE TABLE "armigers" (
 	"blazon" TEXT
 );
 
-CREATE TABLE "channels" (
+CREATE TABLE IF NOT EXISTS "channels" (
 	"discord_id" INTEGER PRIMARY KEY,
 	"guild" INTEGER REFERENCES "guilds"("discord_id") NOT NULL,
 	"proposal" INTEGER DEFAULT 0 NOT NULL,
 	"oc" INTEGER DEFAULT 0 NOT NULL
 );
 
-CREATE TABLE "emblazons" (
+CREATE TABLE IF NOT EXISTS "ds_catalog" (
+	"charge" TEXT PRIMARY KEY COLLATE NOCASE,
+	"entry" TEXT NOT NULL,
+	"fetched" REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "ds_terms" (
+	"term" TEXT PRIMARY KEY COLLATE NOCASE,
+	"content" TEXT NOT NULL,
+	"url" TEXT NOT NULL,
+	"fetched" REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "emblazons" (
 	"id" INTEGER PRIMARY KEY ASC AUTOINCREMENT,
 	"url" TEXT
 );
 
-CREATE TABLE "guilds" (
+CREATE TABLE IF NOT EXISTS "gis_cache" (
+	"query" TEXT NOT NULL,
+	"start" INTEGER DEFAULT 1 NOT NULL,
+	"results" TEXT NOT NULL,
+	"fetched" REAL NOT NULL,
+	PRIMARY KEY ("query", "start")
+);
+
+CREATE TABLE IF NOT EXISTS "guilds" (
 	"discord_id" INTEGER PRIMARY KEY,
 	"name" TEXT NOT NULL,
 	"limit_commands" INTEGER DEFAULT 0 NOT NULL,
@@ -29,17 +50,51 @@ CREATE TABLE "guilds" (
 	"log" INTEGER DEFAULT 0 NOT NULL
 );
 
-CREATE TABLE "misc_store" (
+CREATE TABLE IF NOT EXISTS "hero_terms" (
+	"uri" TEXT PRIMARY KEY,
+	"label" TEXT NOT NULL COLLATE NOCASE,
+	"broader" TEXT DEFAULT "[]" NOT NULL,
+	"narrower" TEXT DEFAULT "[]" NOT NULL,
+	"related" TEXT DEFAULT "[]" NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS "hero_labels" ON "hero_terms"("label");
+
+CREATE TABLE IF NOT EXISTS "locked_threads" (
+	"discord_id" INTEGER PRIMARY KEY,
+	"guild_id" INTEGER NOT NULL REFERENCES "guilds"("discord_id")
+);
+
+CREATE TABLE IF NOT EXISTS "misc_store" (
 	"id" INTEGER PRIMARY KEY ASC AUTOINCREMENT,
 	"key" TEXT NOT NULL UNIQUE,
 	"value" TEXT DEFAULT NULL
 );
 
-INSERT INTO "misc_store" (key, value) VALUES
+INSERT OR IGNORE INTO "misc_store" (key, value) VALUES
 	("book_timestamp", "0"),
-	("last_avatar", "0");
+	("gis_quota_day", ""),
+	("gis_quota_used", "0"),
+	("last_avatar", "0"),
+	("sbw_rebuilt", "0"),
+	("sbw_timestamp", "0");
+
+CREATE TABLE IF NOT EXISTS "proposals" (
+	"discord_id" INTEGER PRIMARY KEY,
+	"channel_id" INTEGER NOT NULL REFERENCES "channels"("discord_id"),
+	"author" TEXT,
+	"author_avatar" TEXT,
+	"content" TEXT
+);
+
+CREATE TABLE IF NOT EXISTS "proposal_reactions" (
+	"proposal" INTEGER NOT NULL REFERENCES "proposals"("discord_id"),
+	"emoji" TEXT NOT NULL,
+	"count" INTEGER DEFAULT 0 NOT NULL,
+	PRIMARY KEY ("proposal", "emoji")
+);
 
-CREATE TABLE "reddit_feeds" (
+CREATE TABLE IF NOT EXISTS "reddit_feeds" (
 	"id" INTEGER PRIMARY KEY ASC AUTOINCREMENT,
 	"guild" INTEGER REFERENCES "guilds"("discord_id") NOT NULL,
 	"channel_id" INTEGER NOT NULL,
@@ -49,7 +104,7 @@ CREATE TABLE "reddit_feeds" (
 	"last_post" TEXT DEFAULT NULL
 );
 
-CREATE TABLE "roll_channels" (
+CREATE TABLE IF NOT EXISTS "roll_channels" (
 	"discord_id" INTEGER PRIMARY KEY,
 	"user_id" INTEGER REFERENCES "armigers"("discord_id"),
 	"guild_id" INTEGER NOT NULL REFERENCES "guilds"("discord_id"),
@@ -57,7 +112,24 @@ CREATE TABLE "roll_channels" (
 	"name" TEXT
 );
 
-CREATE VIEW "armigers_e" AS
+CREATE TABLE IF NOT EXISTS "roll_pins" (
+	"channel_id" INTEGER PRIMARY KEY REFERENCES "roll_channels"("discord_id"),
+	"last_pin" REAL DEFAULT 0 NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "sbw_pages" (
+	"title" TEXT PRIMARY KEY COLLATE NOCASE,
+	"revid" INTEGER DEFAULT 0 NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS "scheduled_actions" (
+	"key" TEXT PRIMARY KEY,
+	"action" TEXT NOT NULL,
+	"due" REAL NOT NULL,
+	"data" TEXT DEFAULT NULL
+);
+
+CREATE VIEW IF NOT EXISTS "armigers_e" AS
 	SELECT *
 	FROM "armigers" LEFT JOIN "emblazons"
 	ON "armigers"."discord_id" == "emblazons"."id";
@@ -1,7 +1,9 @@
 import discord, asyncio, aiohttp, json, logging, os, sys, time, traceback
 from discord.ext import commands
 from collections import defaultdict
-from . import db, utils
+from . import caches, db, utils
+from .ext import SlowTCPConnector
+from .scheduler import EditQueue, Scheduler
 
 class Heraldtron(commands.Bot):
 	DEFAULT_COGS = [
@@ -16,9 +18,13 @@ class Heraldtron(commands.Bot):
 
 	DEFAULT_CONF = {
 		"DB_PATH": "./data/db/heraldtron.db",
+		"GIS_CACHE_TTL": 604800,
+		"GIS_DAILY_QUOTA": 100,
 		"LOG_LEVEL": 20,
 		"OWNER_ONLY": False,
-		"PREFIX": "!"
+		"PREFIX": "!",
+		"RENDER_CACHE_SIZE": 100,
+		"WELCOME_WINDOW": 5
 	}
 
 	HERALDRY_GUILD = 272117928298676225
@@ -28,12 +34,19 @@ class Heraldtron(commands.Bot):
 		self.setup_logging()
 				
 		self.melded_cogs = defaultdict(list)
+		self.message_routes = defaultdict(dict)
 		self.active_dms = set()
 		
 		self.ready_flag = asyncio.Event()
+		self.scheduler = Scheduler(self)
+		self.edits = EditQueue(self)
 		self.session = aiohttp.ClientSession(
 			headers = {"User-Agent": utils.USER_AGENT}
 		) 
+		self.slow_session = SlowTCPConnector.get_slow_session(
+			headers = {"User-Agent": utils.USER_AGENT}
+		)
+		self.renders = caches.RenderCache("./data/renders", self.conf["RENDER_CACHE_SIZE"] * 1024 ** 2)
 		
 		self.reset_cache()	
 		
@@ -53,6 +66,8 @@ class Heraldtron(commands.Bot):
 			**kwargs
 		)
 		
+		self.perm_cache = utils.PermissionCache(self)
+
 		with open("media/ascii_art", "r") as file:
 			self.logger.info(f"Bot initialisation complete.\n{file.read()}")
 		
@@ -82,9 +97,12 @@ class Heraldtron(commands.Bot):
 		
 	def reset_cache(self):
 		self.ready_flag.clear()
-		self.guild_cache = {}
-		self.channel_cache = {}
+		self.guild_cache = db.RecordCache()
+		self.channel_cache = db.RecordCache()
 		self.proposal_cache = {}
+		self.roll_guilds = set()
+
+		self.guild_cache.listen(self.update_roll_guilds)
 		
 	async def load_default_cogs(self, custom_list = None):
 		coglist = custom_list or Heraldtron.DEFAULT_COGS
@@ -97,40 +115,78 @@ class Heraldtron(commands.Bot):
 
 	async def setup_db(self):
 		self.dbc = await db.connect(self.conf["DB_PATH"])
-		count = await self.dbc.execute_fetchone("SELECT COUNT(*) FROM sqlite_master")
 
-		if count[0] == 0:
-			with open("data/db/schema.sql", "r") as file:
-				await self.dbc.executescript(file.read())
-			await self.dbc.commit()
+		#the schema only creates what is missing, so this also adds tables to older databases
+		with open("data/db/schema.sql", "r") as file:
+			await self.dbc.executescript(file.read())
+		await self.dbc.commit()
 
-	async def refresh_cache_guild(self, guild_id):
-		record = await self.dbc.execute_fetchone(
-			"SELECT * FROM guilds WHERE discord_id = ?", (guild_id,)
+	def update_roll_guilds(self, record, removed):
+		if record.roll and not removed: self.roll_guilds.add(record.discord_id)
+		else: self.roll_guilds.discard(record.discord_id)
+
+	async def update_guild(self, guild_id, **changes):
+		#column names come from code, never from user input
+		columns = ", ".join(f"{column} = ?" for column in changes)
+
+		await self.dbc.execute(
+			f"UPDATE guilds SET {columns} WHERE discord_id = ?;", (*changes.values(), guild_id)
 		)
-		guild = await utils.get_guild(self, record[0])
+		await self.dbc.commit()
+
+		return self.guild_cache.patch(guild_id, **changes)
+
+	async def store_proposals(self, records):
+		for record in records:
+			self.proposal_cache[record.discord_id] = record
+
+		await self.dbc.executemany(
+			"INSERT OR REPLACE INTO proposals VALUES (?, ?, ?, ?, ?);",
+			tuple((r.discord_id, r.channel_id, r.author, r.author_avatar, r.content) for r in records)
+		)
+		await self.dbc.executemany(
+			"DELETE FROM proposal_reactions WHERE proposal = ?;",
+			tuple((r.discord_id,) for r in records)
+		)
+		await self.dbc.executemany(
+			"INSERT INTO proposal_reactions VALUES (?, ?, ?);",
+			tuple((r.discord_id, e, c) for r in records for e, c in r.reactions.items())
+		)
+		await self.dbc.commit()
+
+	async def load_proposals(self):
+		for record in await self.dbc.execute_fetchall("SELECT * FROM proposals"):
+			self.proposal_cache[record[0]] = db.ProposalRecord(*record, {})
 
-		if not guild or not record: return
-		self.guild_cache[guild_id] = (guild, record)
+		for proposal, emoji, count in await self.dbc.execute_fetchall(
+			"SELECT * FROM proposal_reactions ORDER BY rowid"
+		):
+			if record := self.proposal_cache.get(proposal):
+				record.reactions[emoji] = count
 
 	async def refresh_cache(self):
 		await self.wait_until_ready()
 
-		async for record in await self.dbc.execute("SELECT * FROM guilds"):
-			guild = await utils.get_guild(self, record[0])
+		for record in await self.dbc.execute_fetchall("SELECT * FROM guilds"):
+			#every guild the bot is still in is available after ready, so no need to fetch
+			guild = self.get_guild(record[0])
+			if guild: self.guild_cache.add(db.GuildRecord(*record, guild))
 
-			if not guild or not record: continue
-			self.guild_cache[record[0]] = (guild, record)
+		await self.load_proposals()
+		scanned = []
 
-		async for record in await self.dbc.execute("SELECT * FROM channels"):
-			self.channel_cache[record[0]] = record
+		for record in await self.dbc.execute_fetchall("SELECT * FROM channels"):
+			record = self.channel_cache.add(db.ChannelRecord(*record))
 
-			if not record[2]: continue
-			channel = await utils.get_channel(self, record[0])
+			if not record.proposal: continue
+			channel = await utils.get_channel(self, record.discord_id)
 
 			async for message in channel.history():
+				#resync counts, as reactions made while offline aren't otherwise seen
 				if not message.flags.has_thread: continue
-				self.proposal_cache[message.id] = (message, time.time())
+				scanned.append(db.ProposalRecord.from_message(message))
+
+		await self.store_proposals(scanned)
 
 		self.ready_flag.set()
 		self.logger.info("Successfully cached data.")
@@ -145,13 +201,37 @@ class Heraldtron(commands.Bot):
 		if isinstance(cog, utils.MeldedCog):
 			self.melded_cogs[cog.category].remove(cog)
 
-	async def get_prefix(self, message):
-		list = (self.command_prefix, f"<@{self.user.id}> ", f"<@!{self.user.id}> ")
+	async def setup_hook(self):
+		#the user is known once logged in, so the prefixes only need to be built once
+		self.prefixes = (self.command_prefix, f"<@{self.user.id}> ", f"<@!{self.user.id}> ")
+
+		if not self.owner_id and not self.owner_ids:
+			#resolve now, so that is_owner never has to fetch application info
+			app = await self.application_info()
 
+			if app.team: self.owner_ids = {m.id for m in app.team.members}
+			else: self.owner_id = app.owner.id
+
+	async def get_prefix(self, message):
 		if not message.guild and message.channel.id not in self.active_dms:
-			return (*list, "")
+			return (*self.prefixes, "")
+
+		return self.prefixes
 
-		return list
+	def add_route(self, channel_id, name, handler):
+		self.message_routes[channel_id][name] = handler
+
+	def remove_route(self, channel_id, name):
+		if not (routes := self.message_routes.get(channel_id)): return
+
+		routes.pop(name, None)
+		if not routes: del self.message_routes[channel_id]
+
+	async def run_route(self, handler, message):
+		try:
+			await handler(message)
+		except Exception:
+			await self.on_error("on_message", message)
 		
 	async def on_error(self, *args, **kwargs):
 		error = sys.exc_info()
@@ -160,13 +240,28 @@ class Heraldtron(commands.Bot):
 		)
 
 	async def on_message(self, message):
-		await self.ready_flag.wait()
+		if routes := self.message_routes.get(message.channel.id):
+			for handler in routes.values():
+				self.loop.create_task(self.run_route(handler, message))
+
+		if (
+			(message.guild or message.channel.id in self.active_dms)
+			and not message.content.startswith(self.prefixes)
+		):
+			return #can't be a command, so avoid building a context
+
+		if not self.ready_flag.is_set():
+			await self.ready_flag.wait()
+
 		await self.process_commands(message)
 
 	async def close(self):
 		self.reset_cache()
+		self.scheduler.stop()
+		self.edits.stop()
 		await self.dbc.close()
 		await self.session.close()
+		await self.slow_session.close()
 		await super().close()
 		
 async def main():
@@ -174,8 +269,10 @@ async def main():
 
 	async with Heraldtron() as bot:
 		await bot.setup_db()
+		await bot.scheduler.load()
 		await bot.load_default_cogs()
 		
+		bot.scheduler.start()
 		bot.loop.create_task(bot.refresh_cache())
 		bot.logger.info(f"Startup time: {time.perf_counter() - start:.3f}s")
 
@@ -1,20 +1,126 @@
-import json, random, functools, re
+import asyncio, json, random, functools, re, statistics, time
+from collections import deque
 from . import services, utils
-from .ext import SlowTCPConnector
 
 class Source():
 	register = {}
+	REFRESH = 21600
+	WIKI_POOL = 100
+	WINDOW = 50
+	DEFAULT_BUDGET = 3
 
 	def __init__(self, name, desc):
 		Source.register[name] = self
+		self.name = name
 		self.desc = desc
+		self.items = None
+		self.fetched = 0
+		self.refreshing = None
+		self.latencies = deque(maxlen = self.WINDOW)
+		self.outcomes = deque(maxlen = self.WINDOW)
 
 	def __call__(self, coroutine):
-		self.retrieve = coroutine
+		self.collect = coroutine
+		return self
+
+	def resolver(self, coroutine):
+		self.resolve = coroutine
+		return self
+
+	async def refresh(self, bot):
+		#cleared by the task itself, as waiters may be cancelled while it keeps running
+		try:
+			self.items = await self.collect(bot)
+			self.fetched = time.monotonic()
+		finally:
+			self.refreshing = None
+
+	async def renew(self, bot):
+		try:
+			await self.refresh(bot)
+		except Exception:
+			#keep serving the old collection until the next attempt
+			bot.logger.warning(f"Could not renew the {self.name} collection", exc_info = True)
+
+	async def retrieve(self, bot):
+		start = time.monotonic()
+		budget = self.budget()
+
+		try:
+			result = await self.retrieve_item(bot)
+		except asyncio.CancelledError:
+			#losing a hedge after the budget means the source was slow, so count it as a timeout
+			#the elapsed time is a lower bound, but without it slow sources only record fast responses
+			if time.monotonic() - start > budget:
+				self.outcomes.append(False)
+				self.latencies.append(time.monotonic() - start)
+			raise
+		except Exception:
+			self.outcomes.append(False)
+			raise
+
+		self.outcomes.append(True)
+		self.latencies.append(time.monotonic() - start)
+		return result
+
+	async def retrieve_item(self, bot):
+		if self.items is None:
+			if not self.refreshing: self.refreshing = asyncio.create_task(self.refresh(bot))
+			await asyncio.shield(self.refreshing)
+		elif time.monotonic() - self.fetched > self.REFRESH and not self.refreshing:
+			self.refreshing = asyncio.create_task(self.renew(bot))
+
+		if not self.items: raise utils.CustomCommandError(
+			"No artifacts available",
+			"This source did not return any usable items. Try another source."
+		)
+
+		return await self.resolve(bot, random.choice(self.items))
+
+	def budget(self):
+		#time after which a hedged request is sent, based on the rolling p90
+		if len(self.latencies) < 5: return self.DEFAULT_BUDGET
+		return statistics.quantiles(self.latencies, n = 10)[-1]
+
+	def weight(self):
+		#the error rate drives the weight; latency only counts against sources over budget,
+		#as sources that pick from a cached list would otherwise crowd out those that make a request
+		success = (sum(self.outcomes) + 1) / (len(self.outcomes) + 2)
+		if not self.latencies: return success
+
+		return success * min(1, self.DEFAULT_BUDGET / statistics.median(self.latencies))
+
+	@staticmethod
+	def random(exclude = None):
+		sources = [source for source in Source.register.values() if source is not exclude]
+		return random.choices(sources, weights = [source.weight() for source in sources])[0]
 
 	@staticmethod
-	def random():
-		return random.choice(list(Source.register.values()))
+	async def hedged(bot):
+		first = Source.random()
+		tasks = {asyncio.create_task(first.retrieve(bot)): first}
+		done, _ = await asyncio.wait(tasks, timeout = first.budget())
+		error = None
+
+		if done and not (error := next(iter(done)).exception()):
+			return first, next(iter(done)).result()
+
+		#the first source is slow or has failed, so race it against another
+		second = Source.random(exclude = first)
+		tasks[asyncio.create_task(second.retrieve(bot))] = second
+		pending = {task for task in tasks if not task.done()}
+
+		try:
+			while pending:
+				done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+
+				for task in done:
+					if task.exception(): error = error or task.exception()
+					else: return tasks[task], task.result()
+		finally:
+			for task in pending: task.cancel()
+
+		raise error
 
 	@staticmethod
 	@functools.cache
@@ -30,8 +136,10 @@ async def rijksmuseum(bot):
 		bot.session,
 		f"https://www.rijksmuseum.nl/api/en/collection?key={api_key}&q=heraldry&ps=100&imgonly=True"
 	)
-	result = random.choice(collection["artObjects"])
+	return collection["artObjects"]
 
+@rijksmuseum.resolver
+async def rijksmuseum_result(bot, result):
 	return (
 		result["links"]["web"],
 		result["title"],
@@ -46,8 +154,10 @@ async def victoria_and_albert(bot):
 		bot.session,
 		f"https://api.vam.ac.uk/v2/objects/search?q=%22coat%20of%20arms%22&page_size=100&year_made_to=1900&images_exist=1"
 	)
-	result = random.choice(collection["records"])
+	return collection["records"]
 
+@victoria_and_albert.resolver
+async def victoria_and_albert_result(bot, result):
 	return (
 		f"https://collections.vam.ac.uk/item/{result['systemNumber']}/",
 		result["_primaryTitle"],
@@ -63,7 +173,10 @@ async def europeana(bot):
 		bot.session,
 		f"https://api.europeana.eu/record/v2/search.json?query=coat%20of%20arms&media=true&rows=100&wskey={api_key}"
 	)
-	result = random.choice(collection["items"])
+	return collection["items"]
+
+@europeana.resolver
+async def europeana_result(bot, result):
 	return (
 		result["guid"],
 		result["title"][0],
@@ -79,13 +192,11 @@ async def digital_nz(bot):
 		bot.session,
 		f"https://api.digitalnz.org/v3/records.json?api_key={api_key}&per_page=100&text=heraldry&and[category][]=Images"
 	)
-	results = collection["search"]["results"]
-	result = {"thumbnail_url": None}
-
-	while result["thumbnail_url"] is None:
-		#no way to filter the results so only items with images appear
-		result = random.choice(results)
+	#no way to filter the results so only items with images appear, so do it once here
+	return [result for result in collection["search"]["results"] if result["thumbnail_url"]]
 
+@digital_nz.resolver
+async def digital_nz_result(bot, result):
 	return (
 		result["landing_url"],
 		result["title"],
@@ -96,16 +207,19 @@ async def digital_nz(bot):
 
 @Source("met", "The Metropolitan Museum of Art, New York")
 async def met_museum(bot):
-	async with SlowTCPConnector.get_slow_session() as slow_session:
-		collection = await utils.get_json(
-			slow_session,
-			"https://collectionapi.metmuseum.org/public/collection/v1/search?hasImages=true&q=%22coat%20of%20arms%22"
-		)
-		resultid = random.choice(collection["objectIDs"])
-		result = await utils.get_json(
-			slow_session,
-			f"https://collectionapi.metmuseum.org/public/collection/v1/objects/{resultid}"
-		)
+	#only refreshed every few hours, so the per-object call is usually the only slow request
+	collection = await utils.get_json(
+		bot.slow_session,
+		"https://collectionapi.metmuseum.org/public/collection/v1/search?hasImages=true&q=%22coat%20of%20arms%22"
+	)
+	return collection["objectIDs"]
+
+@met_museum.resolver
+async def met_museum_result(bot, resultid):
+	result = await utils.get_json(
+		bot.slow_session,
+		f"https://collectionapi.metmuseum.org/public/collection/v1/objects/{resultid}"
+	)
 
 	return (
 		result["objectURL"],
@@ -121,8 +235,10 @@ async def art_institute_chicago(bot):
 		bot.session,
 		"https://api.artic.edu/api/v1/artworks/search?q=coat%20of%20arms&limit=100&fields=id,title,image_id,artist_title"
 	)
-	result = random.choice(collection["data"])
+	return collection["data"]
 
+@art_institute_chicago.resolver
+async def art_institute_chicago_result(bot, result):
 	return (
 		f"https://www.artic.edu/artworks/{result['id']}/",
 		result["title"],
@@ -138,12 +254,13 @@ async def smithsonian(bot):
 		bot.session,
 		f"https://api.si.edu/openaccess/api/v1.0/search?q=coat%20of%20arms&rows=400&api_key={api_key}"
 	)
-	results = collection["response"]["rows"]
-
-	while True: #random choice may seem bad, but checking all 400 is worse
-		result = random.choice(results)
-		if "online_media_type" in result["content"]["indexedStructured"]: break
+	return [
+		result for result in collection["response"]["rows"]
+		if "online_media_type" in result["content"]["indexedStructured"]
+	]
 
+@smithsonian.resolver
+async def smithsonian_result(bot, result):
 	url = f"https://www.si.edu/object/{result['url']}/"
 
 	#the image isn't provided by the api, so scrape the html :(
@@ -159,14 +276,19 @@ async def wikimedia_commons(bot):
 		"https://commons.wikimedia.org/w/api.php?action=query&list=categorymembers"
 		"&cmtype=file&cmtitle=Category:Paintings_of_coats_of_arms&format=json&cmlimit=500"
 	)
-	resultid = random.choice(collection["query"]["categorymembers"])["title"].replace("File:","")
-	result = await services.commons(bot.session, bot.loop, resultid)
+	members = [member["title"].replace("File:","") for member in collection["query"]["categorymembers"]]
+
+	#resolve a random pool up front, so that picking from it needs no further requests
+	pool = random.sample(members, min(len(members), Source.WIKI_POOL))
+	return [result for result in await services.commons(bot.session, *pool) if result]
 
+@wikimedia_commons.resolver
+async def wikimedia_commons_result(bot, result):
 	return (
-		result.find("urls").find("description").text,
-		result.find("title").text,
+		result.description,
+		result.title,
 		"",
-		result.find("urls").find("file").text,
+		result.url,
 		None
 	)
 
@@ -177,8 +299,10 @@ async def deutsche_digitale(bot):
 		bot.session,
 		f"https://api.deutsche-digitale-bibliothek.de/search?query=Heraldik&facet=objecttype_fct&rows=1000&objecttype_fct=Buchmalerei&type_fct=002&oauth_consumer_key={api_key}"
 	)
-	result = random.choice(collection["results"][0]["docs"])
+	return collection["results"][0]["docs"]
 
+@deutsche_digitale.resolver
+async def deutsche_digitale_result(bot, result):
 	return (
 		f"https://www.deutsche-digitale-bibliothek.de/item/{result['id']}/",
 		result["title"],
@@ -0,0 +1,184 @@
+import aiohttp, asyncio, hashlib, json, os, re, time
+from collections import Counter, OrderedDict
+
+class LRUCache(OrderedDict):
+	def __init__(self, maxsize = 128):
+		super().__init__()
+		self.maxsize = maxsize
+
+	def __getitem__(self, key):
+		value = super().__getitem__(key)
+		self.move_to_end(key)
+		return value
+
+	def __setitem__(self, key, value):
+		super().__setitem__(key, value)
+		self.move_to_end(key)
+
+		while len(self) > self.maxsize:
+			self.popitem(last = False)
+
+	def get(self, key, default = None):
+		#OrderedDict.get bypasses __getitem__, so recency has to be updated here too
+		if key not in self: return default
+		return self[key]
+
+class CachedResponse:
+	#a fully read response that mimics the parts of aiohttp.ClientResponse the helpers use
+	JSON_TYPE = re.compile(r"^application/(?:[\w.+-]+?\+)?json")
+
+	def __init__(self, source, body, expires):
+		self.status = source.status
+		self.headers = source.headers
+		self.request_info = source.request_info
+		self.history = source.history
+		self.charset = source.charset
+		self.body = body
+		self.expires = expires
+
+	@property
+	def etag(self):
+		return self.headers.get("ETag")
+
+	@property
+	def modified(self):
+		return self.headers.get("Last-Modified")
+
+	def read(self):
+		return self.body
+
+	def text(self, encoding = None, errors = "strict"):
+		return self.body.decode(encoding or self.charset or "utf-8", errors)
+
+	def json(self, encoding = None, loads = json.loads, content_type = "application/json"):
+		if content_type:
+			actual = self.headers.get("Content-Type", "").lower()
+			expected = self.JSON_TYPE.match(actual) if content_type == "application/json" else content_type in actual
+
+			if not expected:
+				raise aiohttp.ContentTypeError(
+					self.request_info,
+					self.history,
+					message = f"Attempt to decode JSON with unexpected mimetype: {actual}",
+					headers = self.headers
+				)
+
+		text = self.text(encoding)
+		if not text.strip(): return None
+		return loads(text)
+
+class ResponseCache(LRUCache):
+	def __init__(self, maxsize = 256):
+		super().__init__(maxsize)
+		self.stats = Counter()
+
+	async def fetch(self, session, method, url, ttl, **kwargs):
+		key = (method, url, json.dumps(kwargs.get("json"), sort_keys = True))
+		entry = self.get(key)
+		now = time.monotonic()
+
+		if entry and entry.expires > now:
+			self.stats["hits"] += 1
+			return entry
+
+		#expired entries are kept so that they can be revalidated rather than downloaded again
+		headers = dict(kwargs.pop("headers", None) or {})
+		if entry and entry.etag: headers["If-None-Match"] = entry.etag
+		if entry and entry.modified: headers["If-Modified-Since"] = entry.modified
+
+		async with session.request(method, url, headers = headers, **kwargs) as source:
+			if entry and source.status == 304:
+				self.stats["revalidated"] += 1
+				entry.expires = now + ttl
+				return entry
+
+			response = CachedResponse(source, await source.read(), now + ttl)
+
+		self.stats["misses"] += 1
+		if response.status == 200: self[key] = response
+		return response
+
+	def hit_rate(self):
+		total = sum(self.stats.values())
+		if not total: return 0
+		return (self.stats["hits"] + self.stats["revalidated"]) / total
+
+class SingleFlight:
+	#concurrent calls with the same key share one task instead of each doing the work
+	def __init__(self):
+		self.flights = {}
+		self.saved = 0
+
+	async def run(self, key, factory):
+		if key in self.flights:
+			self.saved += 1
+		else:
+			self.flights[key] = asyncio.ensure_future(factory())
+			self.flights[key].add_done_callback(lambda _: self.flights.pop(key, None))
+
+		#shielded so that one caller giving up does not cancel the others
+		return await asyncio.shield(self.flights[key])
+
+class RenderCache:
+	#rendered images on disk, named by a hash of everything that affects the render
+	def __init__(self, path, maxsize):
+		self.path = path
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+		self.size = 0
+
+		os.makedirs(path, exist_ok = True)
+		files = (os.path.join(path, name) for name in os.listdir(path))
+
+		for file in sorted(files, key = os.path.getmtime):
+			self.entries[os.path.basename(file)] = os.path.getsize(file)
+			self.size += self.entries[os.path.basename(file)]
+
+	@staticmethod
+	def key(renderer, options, blazon):
+		blazon = " ".join(blazon.casefold().split())
+		return hashlib.sha256(f"{renderer}\n{' '.join(options)}\n{blazon}".encode()).hexdigest()
+
+	async def get(self, key):
+		if key not in self.entries: return None
+		self.entries.move_to_end(key)
+
+		try:
+			return await asyncio.get_running_loop().run_in_executor(None, self.read, key)
+		except (OSError, ValueError):
+			self.size -= self.entries.pop(key, 0)
+			return None
+
+	async def put(self, key, meta, image = b""):
+		content = json.dumps(meta).encode() + b"\n" + image
+		stale = []
+
+		self.size += len(content) - self.entries.pop(key, 0)
+		self.entries[key] = len(content)
+
+		while self.size > self.maxsize and len(self.entries) > 1:
+			old, size = self.entries.popitem(last = False)
+			self.size -= size
+			stale.append(old)
+
+		await asyncio.get_running_loop().run_in_executor(None, self.write, key, content, stale)
+
+	def read(self, key):
+		path = os.path.join(self.path, key)
+
+		with open(path, "rb") as file:
+			meta, image = file.read().split(b"\n", 1)
+
+		os.utime(path) #keeps the eviction order across restarts
+		return json.loads(meta), image
+
+	def write(self, key, content, stale):
+		with open(os.path.join(self.path, key), "wb") as file:
+			file.write(content)
+
+		for old in stale:
+			try: os.remove(os.path.join(self.path, old))
+			except FileNotFoundError: pass
+
+responses = ResponseCache()
+flights = SingleFlight()
@@ -1,6 +1,7 @@
-import discord, re, sqlite3, time
+import discord, asyncio, re, sqlite3, time
 from discord.ext import commands, tasks
-from .. import embeds, utils
+from collections import deque
+from .. import caches, db, embeds, utils
 
 class GuildEvents(commands.Cog, name = "Guild events"):
 	FIND_MENTIONS = re.compile(r"(?m)(<(#|@|:\w+:)(\d+)>)")
@@ -11,11 +12,30 @@ class GuildEvents(commands.Cog, name = "Guild events"):
 	THUMBS_DOWN = "\U0001F44E"
 	SHRUG = "\U0001F937"
 	
-	REACT_RATE_LIMIT = 300 #5 minutes
+	NAME_CACHE_SIZE = 2000
+	LATENCY_SAMPLES = 100
 
 	def __init__(self, bot):
 		self.bot = bot		
+		self.mention_names = caches.LRUCache(self.NAME_CACHE_SIZE)
+		self.proposal_latency = deque(maxlen = self.LATENCY_SAMPLES)
 		self.bot.loop.create_task(self.update_guilds())
+		self.bot.channel_cache.listen(self.update_route)
+
+		for record in self.bot.channel_cache.values():
+			self.update_route(record, False)
+
+	def cog_unload(self):
+		self.bot.channel_cache.unlisten(self.update_route)
+
+		for channel_id in tuple(self.bot.message_routes):
+			self.bot.remove_route(channel_id, "posts")
+
+	def update_route(self, record, removed):
+		if not removed and (record.proposal or record.oc):
+			self.bot.add_route(record.discord_id, "posts", self.on_post)
+		else:
+			self.bot.remove_route(record.discord_id, "posts")
 	
 	async def update_guilds(self):
 		await self.bot.wait_until_ready()
@@ -26,62 +46,80 @@ class GuildEvents(commands.Cog, name = "Guild events"):
 				self.THUMBS_UP = "<:a_thumbs_up:961787184891973672>"
 				self.THUMBS_DOWN = "<:a_thumbs_down:961787184489316386>"
 		
-			await self.bot.dbc.execute(
+			cursor = await self.bot.dbc.execute(
 				"INSERT OR IGNORE INTO guilds VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
-				(guild.id, guild.name, 0, 0, 1, None, None, 0)
+				self.guild_defaults(guild)
 			)
-			await self.bot.dbc.commit()
+
+			if cursor.rowcount:
+				self.bot.guild_cache.add(db.GuildRecord(*self.guild_defaults(guild), guild))
+
+		await self.bot.dbc.commit()
 			
 	@commands.Cog.listener()
 	async def on_guild_join(self, guild):
 		await self.bot.dbc.execute(
 			"INSERT INTO guilds VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
-			(guild.id, guild.name, 0, 0, 1, None, None, 0)
+			self.guild_defaults(guild)
 		)
 		await self.bot.dbc.commit()
-		await self.bot.refresh_cache_guild(guild.id)
+		self.bot.guild_cache.add(db.GuildRecord(*self.guild_defaults(guild), guild))
 	
 	@commands.Cog.listener()
 	async def on_guild_remove(self, guild):
 		await self.bot.dbc.execute("DELETE FROM guilds WHERE discord_id = ?;",(guild.id,))
 		await self.bot.dbc.commit()
-		del self.bot.guild_cache[guild.id]
+		self.bot.guild_cache.discard(guild.id)
+
+	@staticmethod
+	def guild_defaults(guild):
+		return (guild.id, guild.name, 0, 0, 1, None, None, 0)
 			
-	@commands.Cog.listener()
-	async def on_message(self, message):
-		if message.channel.id not in self.bot.channel_cache: return
-	
+	async def on_post(self, message):
 		channel = self.bot.channel_cache[message.channel.id]
+
+		if not channel.proposal:
+			if channel.oc and len(message.attachments) > 0:
+				await self.create_thread(message, False)
+			return #otherwise, not oc post or no attachments
+
+		start = time.perf_counter()
+		await self.bot.store_proposals((db.ProposalRecord.from_message(message),))
+
+		#reactions share a rate limit bucket and stay in order, but needn't wait for the thread
+		await asyncio.gather(self.add_votes(message), self.create_thread(message, True))
+
+		elapsed = time.perf_counter() - start
+		self.proposal_latency.append(elapsed)
+		self.bot.logger.debug(
+			f"Handled proposal {message.id} in {elapsed * 1000:.0f} ms"
+			f" ({(discord.utils.utcnow() - message.created_at).total_seconds():.3f}s since posting)."
+		)
+
+	async def add_votes(self, message):
+		for emoji in (self.THUMBS_UP, self.THUMBS_DOWN, self.SHRUG):
+			await message.add_reaction(emoji)
+
+	async def create_thread(self, message, proposal):
+		matches = re.findall(self.FIND_MENTIONS, message.content)
 		title = message.content
+
+		if any(match[1][0] != ":" for match in matches):
+			await self.resolve_mentions(message, matches)
 	
-		for match in re.findall(self.FIND_MENTIONS, message.content):
+		for match in matches:
 			#replace mentions and emojis
-	
 			if match[1][0] == ":": #emoji
 				result = match[1][1:-1]
 			else: #user or channel mention
-				lookup = utils.get_channel if match[1] == "#" else utils.get_user
-				id = int(match[2])
-				result = (await lookup(self.bot, id)).name
+				result = self.mention_names.get(int(match[2]), match[0])
 	
 			title = title.replace(match[0], result, 1)
 	
 		title = discord.utils.escape_markdown(title)
 	
-		if channel[2]:
-			#proposal post
-			await message.add_reaction(self.THUMBS_UP)
-			await message.add_reaction(self.THUMBS_DOWN)
-			await message.add_reaction(self.SHRUG)
-	
-			if match := re.search(self.FIND_SENTENCES, title):
-				title = match.group(1)
-			
-			self.bot.proposal_cache[message.id] = (message, time.time())
-	
-		elif not channel[3] or len(message.attachments) < 1:
-			#not oc post or no attachments
-			return
+		if proposal and (match := re.search(self.FIND_SENTENCES, title)):
+			title = match.group(1)
 	
 		if len(title) > self.THREAD_MAX:
 			title = title[:self.THREAD_MAX] + "..."
@@ -90,30 +128,76 @@ class GuildEvents(commands.Cog, name = "Guild events"):
 			title = f"{message.author.name} on {creation}"
 	
 		await message.create_thread(name = title)
+
+	async def resolve_mentions(self, message, matches):
+		#mentioned users and channels come with the message, so only stragglers need fetching
+		for mentioned in (*message.mentions, *message.channel_mentions):
+			self.mention_names[mentioned.id] = mentioned.name
+
+		missing = {}
+
+		for _, kind, id in matches:
+			id = int(id)
+			if kind[0] == ":" or id in self.mention_names: continue
+
+			cached = self.bot.get_channel(id) if kind == "#" else self.bot.get_user(id)
+
+			if cached: self.mention_names[id] = cached.name
+			else: missing[id] = utils.get_channel if kind == "#" else utils.get_user
+
+		results = await asyncio.gather(
+			*(lookup(self.bot, id) for id, lookup in missing.items()),
+			return_exceptions = True
+		)
+
+		for id, result in zip(missing, results):
+			if isinstance(result, Exception): continue
+			self.mention_names[id] = result.name
 	
 	@commands.Cog.listener("on_raw_reaction_add")
 	@commands.Cog.listener("on_raw_reaction_remove")
 	async def reaction_update(self, payload):
-		if payload.message_id not in self.bot.proposal_cache: return
-		
-		channel = await utils.get_channel(self.bot, payload.channel_id)
-		update_time = self.bot.proposal_cache[payload.message_id][1]
-		
-		if update_time < time.time() + self.REACT_RATE_LIMIT: 
-			return
-		
-		self.bot.proposal_cache[payload.message_id] = (
-			await channel.fetch_message(payload.message_id),
-			time.time()
+		if not (proposal := self.bot.proposal_cache.get(payload.message_id)): return
+
+		emoji = str(payload.emoji)
+		change = 1 if payload.event_type == "REACTION_ADD" else -1
+		await self.set_reaction_count(proposal, emoji, proposal.reactions.get(emoji, 0) + change)
+
+	@commands.Cog.listener()
+	async def on_raw_reaction_clear(self, payload):
+		if not (proposal := self.bot.proposal_cache.get(payload.message_id)): return
+
+		for emoji in tuple(proposal.reactions):
+			await self.set_reaction_count(proposal, emoji, 0)
+
+	@commands.Cog.listener()
+	async def on_raw_reaction_clear_emoji(self, payload):
+		if not (proposal := self.bot.proposal_cache.get(payload.message_id)): return
+		await self.set_reaction_count(proposal, str(payload.emoji), 0)
+
+	async def set_reaction_count(self, proposal, emoji, count):
+		proposal.reactions[emoji] = max(count, 0)
+
+		await self.bot.dbc.execute(
+			"INSERT INTO proposal_reactions (proposal, emoji, count) VALUES (?1, ?2, ?3)"
+			" ON CONFLICT(proposal, emoji) DO UPDATE SET count = ?3;",
+			(proposal.discord_id, emoji, proposal.reactions[emoji])
 		)
+		await self.bot.dbc.commit()
 	
 	@commands.Cog.listener()
 	async def on_raw_message_delete(self, payload):
 		record = self.bot.channel_cache.get(payload.channel_id)
-		if not record or not record[2]: return
+		if not record or not record.proposal: return
 	
 		#On proposal deletion
-		message = self.bot.proposal_cache.get(payload.message_id)[0]
+		proposal = self.bot.proposal_cache.pop(payload.message_id, None)
+
+		if not proposal and payload.cached_message:
+			proposal = db.ProposalRecord.from_message(payload.cached_message)
+		elif not proposal:
+			return
+
 		channel = await utils.get_channel(self.bot, payload.channel_id)
 		thread = channel.get_thread(payload.message_id)
 		
@@ -122,18 +206,24 @@ class GuildEvents(commands.Cog, name = "Guild events"):
 			#should be documented though...
 			thread = await self.bot.fetch_channel(payload.message_id)
 	
-		reactions = "\u3000".join(f"{reaction.emoji} {reaction.count}" for reaction in message.reactions)
-		quote = message.content[:400].replace("\n", "\n> ")
+		reactions = "\u3000".join(
+			f"{emoji} {count}" for emoji, count in proposal.reactions.items() if count
+		)
+		quote = proposal.content[:400].replace("\n", "\n> ")
 		embed = embeds.PROPOSAL.create("", f"> {quote}\n\n{reactions}")
 		embed.set_footer(
-			text = f"Original post by {message.author}",
-			icon_url = message.author.display_avatar.with_size(256).url
+			text = f"Original post by {proposal.author}",
+			icon_url = proposal.author_avatar
 		)
 	
+		await self.bot.dbc.execute("DELETE FROM proposals WHERE discord_id = ?;", (proposal.discord_id,))
+		await self.bot.dbc.execute("DELETE FROM proposal_reactions WHERE proposal = ?;", (proposal.discord_id,))
+		await self.bot.dbc.commit()
+	
 		await thread.send(embed = embed)
 		await thread.edit(archived = True)
 	
-		if log_channel := self.bot.guild_cache[payload.guild_id][1][7]:
+		if log_channel := self.bot.guild_cache[payload.guild_id].log:
 			log = await utils.get_channel(self.bot, log_channel)
 			await log.send(embed = embed)
 
@@ -1,12 +1,22 @@
-import discord
+import asyncio, functools, re
 from discord.ext import commands
+from .. import utils
 
 class MemberEvents(commands.Cog, name = "Member events"):
 	TIMEOUT_ROLE_ID = 1003513794909184001
+	WELCOME_VARS = re.compile(r"(GUILD_NAME|MEMBER_NAME|MENTION)")
+	NAME_LIMIT = 3
 	
 	def __init__(self, bot):
 		self.bot = bot
+		self.pending_messages = {}
+		self.timeout_role = None
+
+		self.bot.scheduler.register("remove_timeout", self.remove_timeout)
 		self.bot.loop.create_task(self.register_timeouts())
+
+	def cog_unload(self):
+		self.bot.scheduler.unregister("remove_timeout")
 		
 	async def register_timeouts(self):
 		await self.bot.wait_until_ready()
@@ -19,21 +29,46 @@ class MemberEvents(commands.Cog, name = "Member events"):
 		for member in self.timeout_role.members:
 			if not member.is_timed_out():
 				await member.remove_roles(self.timeout_role)
-			else:
-				self.bot.loop.create_task(self.will_remove_timeout(member))
+			elif self.bot.scheduler.due(self.timeout_key(member)) != member.timed_out_until.timestamp():
+				await self.schedule_timeout(member)
+
+	async def schedule_timeout(self, member):
+		await self.bot.scheduler.schedule(
+			self.timeout_key(member),
+			"remove_timeout",
+			member.timed_out_until.timestamp(),
+			{"member": member.id}
+		)
 		
-	async def will_remove_timeout(self, member):
-		await discord.utils.sleep_until(member.timed_out_until)
+	async def remove_timeout(self, data):
+		guild = self.bot.get_guild(self.bot.HERALDRY_GUILD)
+		member = guild.get_member(data["member"]) if guild else None
+
+		if not member or not self.timeout_role or member.is_timed_out():
+			return #left, or the timeout was extended and rescheduled
+
 		await member.remove_roles(self.timeout_role)
+
+	@staticmethod
+	def timeout_key(member):
+		return f"timeout:{member.id}"
 	
 	@commands.Cog.listener()
 	async def on_member_update(self, before, after):
-		if after.guild.id != self.bot.HERALDRY_GUILD: 
+		if after.guild.id != self.bot.HERALDRY_GUILD or not self.timeout_role: 
 			return
 		
-		if after.is_timed_out() and not before.is_timed_out():
-			await after.add_roles(self.timeout_role)
-			await self.will_remove_timeout(after)
+		if after.is_timed_out():
+			if not before.is_timed_out():
+				await after.add_roles(self.timeout_role)
+
+			if after.timed_out_until != before.timed_out_until:
+				await self.schedule_timeout(after)
+
+		elif before.is_timed_out():
+			#timeout lifted early
+			await self.bot.scheduler.cancel(self.timeout_key(after))
+			await after.remove_roles(self.timeout_role)
 	
 	@commands.Cog.listener()
 	async def on_member_join(self, member):
@@ -44,35 +79,61 @@ class MemberEvents(commands.Cog, name = "Member events"):
 		await self.post_welcome_message(member, True)
 
 	async def post_welcome_message(self, member, leave):
-		guild_db = await self.bot.dbc.execute_fetchone("SELECT * FROM guilds WHERE discord_id == ?;", (member.guild.id,))
+		record = self.bot.guild_cache.get(member.guild.id)
+
+		if not record or not record.welcome_users:
+			#if guild not cached (shouldn't happen) or if disabled
+			return
+
+		key = (member.guild.id, leave)
 
-		if not guild_db or not guild_db[4]:
-			#if guild not in db (shouldn't happen) or if disabled
+		if key in self.pending_messages:
+			#a message is already waiting, so coalesce into it
+			self.pending_messages[key].append(member)
 			return
 
-		if leave: message, emoji = guild_db[6], ":outbox_tray:"
-		else: message, emoji = guild_db[5], ":inbox_tray:"
+		self.pending_messages[key] = [member]
+		await asyncio.sleep(self.bot.conf["WELCOME_WINDOW"])
+		members = self.pending_messages.pop(key)
+
+		if leave: message, emoji = record.leave_text, ":outbox_tray:"
+		else: message, emoji = record.welcome_text, ":inbox_tray:"
 
 		if not message:
 			message = f"We're sorry to see you leaving, **MEMBER_NAME**." if leave else f"Welcome to the **GUILD_NAME** server, MENTION."
 
-		formatted = self.welcome_fmt(member, message)
+		formatted = self.welcome_fmt(members, message)
 
-		await member.guild.system_channel.send(f"{emoji} | {formatted}")
+		if channel := member.guild.system_channel:
+			await channel.send(f"{emoji} | {formatted}")
 
-	def welcome_fmt(self, member, subst_text):
+	def welcome_fmt(self, members, subst_text):
 		if not subst_text: return None
 
 		special_vars = {
-			"GUILD_NAME": member.guild.name,
-			"MEMBER_NAME": str(member),
-			"MENTION": member.mention
+			"GUILD_NAME": members[0].guild.name,
+			"MEMBER_NAME": self.join_names(tuple(str(m) for m in members)),
+			"MENTION": self.join_names(tuple(m.mention for m in members))
 		}
 
-		for name, value in special_vars.items():
-			subst_text = subst_text.replace(name,value)
+		#the template alternates between literal text and variable names
+		parts = self.parse_template(subst_text)
+		return "".join(special_vars[part] if i % 2 else part for i, part in enumerate(parts))
+
+	@classmethod
+	@functools.cache
+	def parse_template(cls, subst_text):
+		return tuple(re.split(cls.WELCOME_VARS, subst_text))
+
+	@classmethod
+	def join_names(cls, names):
+		if len(names) > cls.NAME_LIMIT:
+			others = utils.pluralise("other", len(names) - cls.NAME_LIMIT)
+			return f"{', '.join(names[:cls.NAME_LIMIT])} and {others}"
+		elif len(names) > 1:
+			return f"{', '.join(names[:-1])} and {names[-1]}"
 
-		return subst_text
+		return names[0]
 
 async def setup(bot):
 	await bot.add_cog(MemberEvents(bot))
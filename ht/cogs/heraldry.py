@@ -1,4 +1,4 @@
-import discord, csv, json, random, re
+import discord, csv, json, random, re, urllib
 from discord.ext import commands
 from .. import converters, embeds, services, utils, views
 from ..artifacts import Source
@@ -19,16 +19,16 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	@utils.trigger_typing
 	async def artifact(self, ctx, source = "all"):
 		if source == "all":
-			museum = Source.random()
+			museum, result = await Source.hedged(ctx.bot)
 		elif source in Source.register:
 			museum = Source.register[source]
+			result = await museum.retrieve(ctx.bot)
 		else:
 			raise utils.CustomCommandError(
 				"Invalid artifact source",
 				"Check your spelling and try again."
 			)
 
-		result = await museum.retrieve(ctx.bot)
 		title = discord.utils.escape_markdown(result[1])
 
 		embed = embeds.SEARCH_RESULT.create(title, result[2], heading = "Random artifact")
@@ -46,7 +46,7 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	)
 	@utils.trigger_typing
 	async def ds_catalog(self, ctx, *, charge):
-		catalog = await services.ds_catalog(self.bot.session, charge)
+		catalog = await services.ds_catalog(self.bot, charge)
 
 		if catalog == None: raise utils.CustomCommandError(
 			"Invalid catalog item",
@@ -76,7 +76,7 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	)
 	@utils.trigger_typing
 	async def ds_challenge(self, ctx, source = "all"):
-		url = await utils.get_json(self.bot.session, f"https://drawshield.net/api/challenge/{source}")
+		url = await utils.get_json(self.bot.session, f"https://drawshield.net/api/challenge/{source}", coalesce = False)
 
 		if isinstance(url, dict) and "error" in url:
 			raise utils.CustomCommandError(
@@ -89,10 +89,9 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 		embed.set_footer(text = "Retrieved using DrawShield; © Karl Wilcox. ")
 
 		if url.startswith("https://commons.wikimedia.org"):
-			result = await services.commons(
-				self.bot.session, self.bot.loop, url.removeprefix("https://commons.wikimedia.org//wiki/")
-			)
-			embed.set_image(url = result.find("urls").find("thumbnail").text)
+			filename = urllib.parse.unquote(url.removeprefix("https://commons.wikimedia.org//wiki/"))
+			result, = await services.commons(self.bot.session, filename.removeprefix("File:"))
+			embed.set_image(url = result.thumbnail if result else url)
 
 		else: embed.set_image(url = url)
 
@@ -105,7 +104,7 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	)
 	@utils.trigger_typing
 	async def drawshield(self, ctx, *, blazon : str):
-		embed, file = await services.ds(self.bot.session, blazon, "Shield")
+		embed, file = await services.ds(self.bot, blazon, "Shield")
 		await ctx.send(embed = embed, file = file)
 
 	@commands.command(
@@ -261,10 +260,10 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	)
 	@utils.trigger_typing
 	async def ds_random(self, ctx):
-		blazon = await utils.get_text(self.bot.session, "https://drawshield.net/include/randomblazon.php")
+		blazon = await utils.get_text(self.bot.session, "https://drawshield.net/include/randomblazon.php", coalesce = False)
 		blazon = re.sub(self.RAND_SUB, " ", blazon.removesuffix("created by Drawshield.net/random\n")).strip()
 
-		embed, file = await services.ds(self.bot.session, blazon, "Random shield")
+		embed, file = await services.ds(self.bot, blazon, "Random shield")
 		await ctx.send(embed = embed, file = file)
 
 	@commands.command(
@@ -273,7 +272,7 @@ class HeraldryMisc(utils.MeldedCog, name = "General", category = "Heraldry"):
 	)
 	@utils.trigger_typing
 	async def heraldicon(self, ctx, *, blazon : str):
-		embed, file = await services.heraldicon(self.bot.session, blazon)
+		embed, file = await services.heraldicon(self.bot, blazon)
 		await ctx.send(embed = embed, file = file)
 
 	@commands.command(
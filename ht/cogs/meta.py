@@ -1,6 +1,6 @@
 import discord, aiohttp, aiosqlite, platform, os, re
 from discord.ext import commands
-from .. import utils, views, embeds, __copyright__, __version__
+from .. import caches, services, utils, views, embeds, __copyright__, __version__
 
 class MetaTools(utils.MeldedCog, name = "Meta", category = "Other", limit = False):
 	RNAMES = re.compile("(?m)^(?:NAME|VERSION_ID)=\"?(.+?)\"?\n")
@@ -67,6 +67,30 @@ class MetaTools(utils.MeldedCog, name = "Meta", category = "Other", limit = Fals
 
 		await ctx.send(embed = embed, view = view)
 
+	@commands.command(help = "Displays cache statistics.", hidden = True)
+	@commands.is_owner()
+	async def stats(self, ctx):
+		responses = caches.responses
+		embed = embeds.GENERIC.create("Cache statistics", "", heading = "Meta")
+
+		embed.add_field(name = "Responses", value = (
+			f"{len(responses)}/{responses.maxsize} cached\n"
+			f"{responses.stats['hits']} hits, {responses.stats['revalidated']} revalidated, "
+			f"{responses.stats['misses']} misses\n"
+			f"**{responses.hit_rate():.1%}** hit rate"
+		), inline = False)
+		embed.add_field(name = "Requests", value = (
+			f"{caches.flights.saved} saved by sharing identical in-flight requests"
+		), inline = False)
+
+		cached = await self.bot.dbc.execute_fetchone("SELECT COUNT(*) FROM gis_cache;")
+		embed.add_field(name = "Image search", value = (
+			f"{await services.gis_usage(self.bot)}/{self.bot.conf['GIS_DAILY_QUOTA']} queries used today\n"
+			f"{cached[0]} result pages cached"
+		), inline = False)
+
+		await ctx.send(embed = embed)
+
 	def get_os_name(self):
 		if os.path.exists("/etc/os-release"):
 			with open("/etc/os-release") as file:
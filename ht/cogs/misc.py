@@ -1,7 +1,7 @@
-import discord, asyncio, typing, random, os, html
+import discord, asyncio, typing, random, os, html, time
 from discord import ui
 from discord.ext import commands
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime, timezone, timedelta
 from .. import converters, embeds, services, utils, views
 
@@ -15,14 +15,43 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 		4: "Activity:",
 		5: "Competing in"
 	}
+	TRIVIA_TIME = 60
+	TRIVIA_BATCH = 50
+	TRIVIA_LOW = 10
+	TRIVIA_INTERVAL = 5
+	TRIVIA_ATTEMPTS = 3
+	COUNTDOWN_CADENCE = (
+		(86400, 3600), #over a day left, hourly
+		(3600, 600),
+		(600, 60),
+		(60, 15),
+		(0, 5)
+	)
 
 	def __init__(self, bot):
 		self.bot = bot
+		self.trivia_responses = {}
+		self.trivia_pools = defaultdict(deque)
+		self.trivia_refills = {}
+		self.trivia_lock = asyncio.Lock()
+		self.trivia_token = None
+		self.trivia_categories = None
+		self.last_trivia = 0
+		self.queue_refill(-1)
+		self.bot.scheduler.register("reveal_trivia", self.reveal_trivia)
+		self.bot.scheduler.register("update_countdown", self.update_countdown)
+
+	def cog_unload(self):
+		for task in tuple(self.trivia_refills.values()): task.cancel()
+		self.bot.scheduler.unregister("reveal_trivia")
+		self.bot.scheduler.unregister("update_countdown")
 
 	@commands.command(help = "Retrieves a random piece of advice.\nUses adviceslip.com", aliases = ("ad",))
 	@utils.trigger_typing
 	async def advice(self, ctx):
-		result = await utils.get_json(self.bot.session,f"https://api.adviceslip.com/advice",content_type="text/html")
+		result = await utils.get_json(
+			self.bot.session, f"https://api.adviceslip.com/advice", content_type = "text/html", coalesce = False
+		)
 
 		embed = embeds.GENERIC.create(result["slip"]["advice"], "", heading = "Random advice")
 		embed.set_footer(text=f"Retrieved using adviceslip.com")
@@ -34,8 +63,6 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 	)
 	async def countdown(self, ctx, *, elapsed : converters.Date):
 		delta = (elapsed - datetime.now(tz = timezone.utc)) + timedelta(minutes = 1)
-		embed = embeds.COUNTDOWN.create(f"<t:{elapsed.timestamp():.0f}:R>", "")
-		embed.add_field(name = "End time", value = f"<t:{elapsed.timestamp():.0f}:F>")
 
 		if delta.total_seconds() < 0:
 			raise utils.CustomCommandError(
@@ -48,8 +75,54 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 			" Give it a name by responding below."
 		)).content
 
-		embed.description = desc
-		message = await ctx.send(embed = embed)
+		data = {"channel": ctx.channel.id, "end": elapsed.timestamp(), "name": desc}
+		message = await ctx.send(embed = self.countdown_embed(data))
+
+		data["message"] = message.id
+		await self.schedule_countdown(data)
+
+	async def update_countdown(self, data):
+		key = f"countdown:{data['message']}"
+
+		async def missing():
+			await self.bot.scheduler.cancel(key)
+
+		self.bot.edits.submit(
+			data["channel"], data["message"], missing, embed = self.countdown_embed(data)
+		)
+
+		if data["end"] > time.time():
+			await self.schedule_countdown(data)
+
+	async def schedule_countdown(self, data):
+		remaining = data["end"] - time.time()
+		#already ended, so the final edit is due straight away
+		interval = next((i for (threshold, i) in self.COUNTDOWN_CADENCE if remaining > threshold), 0)
+
+		await self.bot.scheduler.schedule(
+			f"countdown:{data['message']}",
+			"update_countdown",
+			min(time.time() + interval, data["end"]),
+			data
+		)
+
+	@staticmethod
+	def countdown_embed(data):
+		remaining = data["end"] - time.time()
+		embed = embeds.COUNTDOWN.create(f"<t:{data['end']:.0f}:R>", data["name"])
+		embed.add_field(name = "End time", value = f"<t:{data['end']:.0f}:F>")
+
+		if remaining <= 0:
+			left = "**Ended**"
+		elif remaining < 60:
+			left = utils.pluralise("second", max(int(-(-remaining // 5) * 5), 5))
+		else:
+			minutes = int(-(-remaining // 60))
+			units = (("day", minutes // 1440), ("hour", minutes // 60 % 24), ("minute", minutes % 60))
+			left = ", ".join(utils.pluralise(name, count) for name, count in units if count)
+
+		embed.add_field(name = "Time remaining", value = left)
+		return embed
 
 	@commands.command(
 		help = "Generates a competition distribution.\n If no number is specified, asks for a list of names.",
@@ -143,17 +216,24 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 	)
 	@utils.trigger_typing
 	async def trivia(self, ctx, category : typing.Optional[int] = -1):
-		catstring = "" if category == -1 else f"&category={category}"
-		json = f"https://opentdb.com/api.php?amount=1{catstring}"
-		result = await utils.get_json(self.bot.session, json)
+		categories = await self.get_categories()
 
-		if result["response_code"] == 1:
+		if category != -1 and category not in (c["id"] for c in categories):
 			raise utils.CustomCommandError(
 				"Invalid category code",
 				f"Consult `{ctx.clean_prefix}trivia categories` to see the available codes."
 			)
 
-		result = result["results"][0]
+		pool = self.trivia_pools[category]
+
+		if pool:
+			result = pool.popleft()
+		else:
+			#don't wait behind paced batch refills; fetch one question now and fill the pool after
+			result = await self.fetch_question(category)
+
+		if len(pool) < self.TRIVIA_LOW: self.queue_refill(category)
+
 		info = f"**{result['category']}** | {result['difficulty'].capitalize()}\n\n"
 		embed = embeds.GENERIC.create(html.unescape(result["question"]), info, heading = "Trivia")
 		correct = random.randrange(0,2 if result["type"] == "boolean" else 4)
@@ -169,12 +249,117 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 		tuple(view.add_item(views.TriviaButton(answer, users)) for answer in answers)
 
 		message = await ctx.send(embed = embed, view = view)
-		await asyncio.sleep(60)
+		self.trivia_responses[message.id] = users
+
+		await self.bot.scheduler.schedule(
+			f"trivia:{message.id}",
+			"reveal_trivia",
+			time.time() + self.TRIVIA_TIME,
+			{
+				"channel": message.channel.id,
+				"message": message.id,
+				"question": embed.title,
+				"info": info,
+				"answer": html.unescape(answers[correct])
+			}
+		)
+
+	async def fetch_question(self, category):
+		catstring = "" if category == -1 else f"&category={category}"
+		token = f"&token={self.trivia_token}" if self.trivia_token else ""
+
+		#skips the lock so it doesn't queue behind batch refills, but still keeps to the spacing
+		for attempt in range(self.TRIVIA_ATTEMPTS):
+			await self.wait_for_trivia()
+			result = await utils.get_json(
+				self.bot.session, f"https://opentdb.com/api.php?amount=1{catstring}{token}", coalesce = False
+			)
+
+			if result["response_code"] != 5: break #5 means rate limited
+
+		if result["response_code"] != 0: raise utils.CustomCommandError(
+			"Trivia unavailable",
+			"No questions could be retrieved from the Open Trivia Database. Try again shortly."
+		)
+
+		return result["results"][0]
+
+	def queue_refill(self, category):
+		if category not in self.trivia_refills:
+			self.trivia_refills[category] = asyncio.create_task(self.refill_trivia(category))
+			self.trivia_refills[category].add_done_callback(lambda task: self.refill_done(category, task))
+
+		return self.trivia_refills[category]
+
+	def refill_done(self, category, task):
+		self.trivia_refills.pop(category, None)
 
-		embed.description = f"{info}The correct answer is: **{html.unescape(answers[correct])}**"
-		updated = await message.channel.fetch_message(message.id)
+		if not task.cancelled() and task.exception():
+			self.bot.logger.warning(f"Could not refill trivia category {category}", exc_info = task.exception())
 
-		if updated is None: return #message deleted
+	async def refill_trivia(self, category):
+		#small categories can't fill a whole batch, so fall back to fewer questions
+		for amount in (self.TRIVIA_BATCH, self.TRIVIA_LOW, 1):
+			code, results = await self.request_trivia(category, amount)
+
+			if code == 0:
+				self.trivia_pools[category].extend(results)
+				return
+			elif code != 1: return
+
+	async def request_trivia(self, category, amount):
+		catstring = "" if category == -1 else f"&category={category}"
+
+		#opentdb allows one request every five seconds, so requests are serialised and spaced
+		async with self.trivia_lock:
+			for attempt in range(self.TRIVIA_ATTEMPTS):
+				if not self.trivia_token:
+					await self.wait_for_trivia()
+					token = await utils.get_json(self.bot.session, "https://opentdb.com/api_token.php?command=request")
+					self.trivia_token = token["token"]
+
+				await self.wait_for_trivia()
+				result = await utils.get_json(
+					self.bot.session, f"https://opentdb.com/api.php?amount={amount}{catstring}&token={self.trivia_token}"
+				)
+
+				if result["response_code"] == 5:
+					continue #rate limited, so try again after the next interval
+				elif result["response_code"] == 3:
+					self.trivia_token = None #expired
+				elif result["response_code"] == 4:
+					#every question has been seen with this token, so start over
+					await self.wait_for_trivia()
+					await utils.get_json(
+						self.bot.session, f"https://opentdb.com/api_token.php?command=reset&token={self.trivia_token}"
+					)
+				else: break
+
+		return result["response_code"], result.get("results", [])
+
+	async def wait_for_trivia(self):
+		#the slot is claimed before sleeping, so concurrent callers queue up instead of colliding
+		slot = max(time.monotonic(), self.last_trivia + self.TRIVIA_INTERVAL)
+		self.last_trivia = slot
+		await asyncio.sleep(slot - time.monotonic())
+
+	async def get_categories(self):
+		#the category list is effectively static, so it is only fetched once
+		if not self.trivia_categories:
+			result = await utils.get_json(self.bot.session, "https://opentdb.com/api_category.php")
+			self.trivia_categories = result["trivia_categories"]
+
+		return self.trivia_categories
+
+	async def reveal_trivia(self, data):
+		#responses are only known to this process, so a restart reveals the answer alone
+		users = self.trivia_responses.pop(data["message"], {})
+		embed = embeds.GENERIC.create(
+			data["question"],
+			f"{data['info']}The correct answer is: **{data['answer']}**",
+			heading = "Trivia"
+		)
+		embed.set_footer(text = f"Courtesy of the Open Trivia Database.")
 
 		results = defaultdict(list)
 
@@ -184,16 +369,20 @@ class MiscStuff(utils.MeldedCog, name = "Miscellaneous", category = "Other", lim
 		stats = "\n".join(f"- {a}: {','.join(u)} (**{len(u)}**)" for a, u in results.items())
 		if stats: embed.description += f"\n\n**Responses:**\n\u0020{stats}"
 
-		await message.edit(embed = embed, view = None)
+		channel = self.bot.get_partial_messageable(data["channel"])
+
+		try:
+			await channel.get_partial_message(data["message"]).edit(embed = embed, view = None)
+		except discord.NotFound:
+			pass #message deleted
 
 	@trivia.command(help = "Lists all categories.")
 	async def categories(self, ctx):
-		result = await utils.get_json(self.bot.session, f"https://opentdb.com/api_category.php")
 		embed = embeds.GENERIC.create(
 			"Trivia categories", "To choose a category, specify its numeric ID.", heading = "Trivia"
 		)
 
-		for category in result["trivia_categories"]:
+		for category in await self.get_categories():
 			embed.add_field(name = category["name"], value=category["id"], inline=True)
 
 		embed.set_footer(text = f"Courtesy of the Open Trivia Database.")
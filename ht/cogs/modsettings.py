@@ -1,7 +1,7 @@
 import discord, asyncio, typing, re
 from discord import ui
 from discord.ext import commands
-from .. import converters, embeds, utils, views
+from .. import converters, db, embeds, utils, views
 
 class ModerationSettings(utils.ModCog, name = "Settings"):
 	MAX_FEEDS = 3
@@ -29,10 +29,8 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 	@commands.command(help = "Disables bot logging functions.", aliases = ("dl",))
 	async def dellog(self, ctx):
 		guild = await ModerationSettings.choose_guild(ctx)
-		await ctx.bot.dbc.execute(f"UPDATE guilds SET log = 0 WHERE discord_id = ?", (guild.id,))
-		await ctx.bot.dbc.commit()
+		await ctx.bot.update_guild(guild.id, log = 0)
 		await ctx.send(f":spy: | Logging has been **disabled** for this server.")
-		await ctx.bot.refresh_cache_guild(guild.id)
 
 	@commands.command(name = "limit", help = "Enables/disables non-essential commands for this server.", aliases = ("li",))
 	async def limitmessages(self, ctx, enabled : bool):
@@ -49,10 +47,8 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 	@commands.command(help = "Sets up bot logging functions in a channel.", aliases = ("lc",))
 	async def log(self, ctx, channel : discord.TextChannel):
 		guild = await ModerationSettings.choose_guild(ctx)
-		await ctx.bot.dbc.execute(f"UPDATE guilds SET log = ?1 WHERE discord_id = ?2", (channel.id, guild.id))
-		await ctx.bot.dbc.commit()
+		await ctx.bot.update_guild(guild.id, log = channel.id)
 		await ctx.send(f":spy: | Logging has been **enabled** for this server in {channel.mention}.")
-		await ctx.bot.refresh_cache_guild(guild.id)
 
 	@commands.command(help = "Sets the leave message for this server.", aliases = ("sl", "setl"))
 	async def setleave(self, ctx):
@@ -67,13 +63,12 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 		if isinstance(ctx.channel, discord.abc.GuildChannel): return ctx.guild
 
 		possible = []
-		for guild in ctx.author.mutual_guilds:
-			if await ctx.bot.is_owner(ctx.author):
-				possible.append(guild)
-				continue
+		owner = await ctx.bot.is_owner(ctx.author)
 
-			perms = guild.get_member(ctx.author.id).guild_permissions
-			if perms.manage_guild or perms.administrator:
+		for guild in ctx.bot.perm_cache.mutual_guilds(ctx.author):
+			perms = ctx.bot.perm_cache.get(guild, ctx.author.id)
+
+			if owner or (perms and (perms.manage_guild or perms.administrator)):
 				possible.append(guild)
 
 		if len(possible) == 1:
@@ -90,6 +85,11 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 		guild = await self.choose_guild(ctx)
 		value = int(not remove)
 
+		if guild != channel.guild:
+			raise utils.CustomCommandError(
+				"Incorrect server", "The channel specified does not belong to this server."
+			)
+
 		await self.bot.dbc.execute(
 			f"INSERT INTO channels (discord_id, guild, {column}) VALUES " +
 			f"(?1, ?2, ?3) ON CONFLICT(discord_id) DO UPDATE SET {column} = ?3;",
@@ -97,14 +97,10 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 		)
 		await ctx.bot.dbc.commit()
 
-		if guild != channel.guild:
-			raise utils.CustomCommandError(
-				"Incorrect server", "The channel specified does not belong to this server."
-			)
-
-		self.bot.channel_cache[channel.id] = await self.bot.dbc.execute_fetchone(
-			"SELECT * FROM channels WHERE discord_id = ?;", (channel.id,)
-		)
+		if not self.bot.channel_cache.patch(channel.id, **{column: value}):
+			record = db.ChannelRecord(channel.id, guild.id, 0, 0)
+			setattr(record, column, value)
+			self.bot.channel_cache.add(record)
 
 		await ctx.send(
 			f":white_check_mark: | {channel.mention} set up for {purpose}."
@@ -118,18 +114,15 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 		enabled_int = int(enabled)
 		enabled_text = "enabled" if enabled else "disabled"
 
-		await ctx.bot.dbc.execute(f"UPDATE guilds SET {db_col} = ?1 WHERE discord_id = ?2", (enabled_int, guild.id))
-		await ctx.bot.dbc.commit()
+		await ctx.bot.update_guild(guild.id, **{db_col: enabled_int})
 		await ctx.send(f"{emoji} | {desc} been **{enabled_text}** for this server.")
 
-		await ctx.bot.refresh_cache_guild(guild.id)
-
 	@staticmethod
 	async def set_message(ctx, leave):
 		guild = await ModerationSettings.choose_guild(ctx)
-		enabled = await ctx.bot.dbc.execute("SELECT welcome_users FROM guilds WHERE discord_id == ?1;", (guild.id,))
+		record = ctx.bot.guild_cache.get(guild.id)
 
-		if enabled == 0: raise utils.CustomCommandError(
+		if not record or not record.welcome_users: raise utils.CustomCommandError(
 			"Welcome and leave messages disabled",
 			"Your message cannot be set, as the welcome and leave message functionality"
 			f" is currently not operational. Turn it on with `{ctx.clean_prefix}messages yes`."
@@ -145,8 +138,7 @@ class ModerationSettings(utils.ModCog, name = "Settings"):
 			message_type = "welcome_text" if not leave else "leave_text"
 			new = None if isinstance(result, str) else result.content
 
-			await ctx.bot.dbc.execute(f"UPDATE guilds SET {message_type} = ?1 WHERE discord_id = ?2;", (new, guild.id))
-			await ctx.bot.dbc.commit()
+			await ctx.bot.update_guild(guild.id, **{message_type: new})
 			await ctx.send(":white_check_mark: | Message changed.")
 
 async def setup(bot):
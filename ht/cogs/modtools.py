@@ -1,4 +1,4 @@
-import discord, typing, re
+import discord, asyncio, typing, re, time
 from discord.ext import commands
 from datetime import datetime
 from .. import embeds, utils, views
@@ -6,22 +6,64 @@ from .. import embeds, utils, views
 class ModerationTools(utils.ModCog, name = "Tools"):
 	HAS_MARKDOWN = re.compile(r"<@!?|<#|<&|\*{1,2}\w")
 	SHORT_MESSAGE = 200
+	ARCHIVE_INTERVAL = 10
 
 	def __init__(self, bot):
 		self.bot = bot
 		self.locked_threads = set()
+		self.pending_archives = set()
+		self.last_archived = {}
+
+		self.bot.loop.create_task(self.load_locks())
 		
-	@commands.Cog.listener()
-	async def on_message(self, message):
+	def cog_unload(self):
+		for channel_id in self.locked_threads:
+			self.bot.remove_route(channel_id, "lock")
+
+	async def load_locks(self):
+		for row in await self.bot.dbc.execute_fetchall("SELECT discord_id FROM locked_threads"):
+			self.locked_threads.add(row[0])
+			self.bot.add_route(row[0], "lock", self.enforce_lock)
+
+	async def set_lock(self, channel, locked):
+		if locked:
+			self.locked_threads.add(channel.id)
+			self.bot.add_route(channel.id, "lock", self.enforce_lock)
+			await self.bot.dbc.execute(
+				"INSERT OR IGNORE INTO locked_threads VALUES (?, ?);", (channel.id, channel.guild.id)
+			)
+		else:
+			self.locked_threads.discard(channel.id)
+			self.bot.remove_route(channel.id, "lock")
+			await self.bot.dbc.execute("DELETE FROM locked_threads WHERE discord_id = ?;", (channel.id,))
+
+		await self.bot.dbc.commit()
+
+	async def enforce_lock(self, message):
 		#to make thread locking work, the bot archives threads and redoes it each time a message is posted
-		if message.channel.id not in self.locked_threads: 
-			return
-		
-		#exempt unlock message
-		elif any(message.content == f"{a}unlock" for a in await self.bot.get_prefix(message)):
-			return
+		if any(message.content == f"{a}unlock" for a in self.bot.prefixes):
+			return #exempt unlock message
+
+		channel = message.channel
+		if channel.id in self.pending_archives: return #a burst only needs one archive
 		
-		await message.channel.edit(locked = True, archived = True)
+		self.pending_archives.add(channel.id)
+
+		try:
+			delay = self.last_archived.get(channel.id, 0) + self.ARCHIVE_INTERVAL - time.monotonic()
+			if delay > 0: await asyncio.sleep(delay)
+
+			if channel.id in self.locked_threads:
+				await channel.edit(locked = True, archived = True)
+				self.last_archived[channel.id] = time.monotonic()
+		finally:
+			self.pending_archives.discard(channel.id)
+
+	@commands.Cog.listener()
+	async def on_raw_thread_delete(self, payload):
+		if payload.thread_id in self.locked_threads:
+			self.last_archived.pop(payload.thread_id, None)
+			await self.set_lock(discord.Object(payload.thread_id), False)
 	
 	@commands.guild_only()	
 	@commands.command(
@@ -70,11 +112,11 @@ class ModerationTools(utils.ModCog, name = "Tools"):
 			) 
 						
 			await channel.edit(locked = True, archived = True)
-			self.locked_threads.add(channel.id)
+			await self.set_lock(channel, True)
 		
 		elif is_thread:
 			await channel.edit(locked = False, archived = False)
-			self.locked_threads.remove(channel.id)
+			await self.set_lock(channel, False)
 			
 			await ctx.send(f":unlock: | **{channel.mention} has been unlocked.**")	
 					
@@ -1,12 +1,19 @@
-import urllib, re
+import asyncio, urllib, re
 from discord.ext import commands
-from .. import embeds, services, utils
+from .. import caches, embeds, services, utils
 
 class HeraldryReference(utils.MeldedCog, name = "Reference", category = "Heraldry"):
 	SBW_SUB = re.compile(r"== *(.*) *==|'{2,4}([^']*)'{2,4}|<ref>.+?</ref>|<[^<]+?>|\[+[^\[]+?\]+")
+	HERO_KINDS = {
+		"primary": "**Primary**:",
+		"broader": "Broader:",
+		"narrower": "Narrower:",
+		"related": "Related:"
+	}
 
 	def __init__(self, bot):
 		self.bot = bot
+		self.sbw_texts = caches.LRUCache(256) #parsed page text by revision id
 
 	@commands.command(
 		help = "Finds the results of `coat of arms [query]` using Google Images.",
@@ -22,43 +29,19 @@ class HeraldryReference(utils.MeldedCog, name = "Reference", category = "Heraldr
 	)
 	@utils.trigger_typing
 	async def hero(self, ctx, *, term):
-		query = await utils.get_json(
-			self.bot.session,
-			f"http://api.finto.fi/rest/v1/search?vocab=hero&query={urllib.parse.quote(term)}&lang=en"
-		)
+		entries = await services.hero_local(self.bot, term) or await services.hero_live(self.bot, term)
 
-		if len(query["results"]) == 0:
+		if not entries:
 			raise utils.CustomCommandError(
 				"Invalid HERO term",
 				"The term could not be found. Check that it is entered correctly, or try other sources."
 			)
 
-		uri = query["results"][0]["uri"]
-
-		results = await utils.get_json(
-			self.bot.session,
-			f"http://api.finto.fi/rest/v1/hero/data?format=application%2Fjson&uri={urllib.parse.quote(uri)}&lang=en"
-		)
-		results = results["graph"]
 		embed = embeds.SEARCH_RESULT.create(f"Results for \"{term}\"", f"", heading = "HERO results")
 
-		for result in results:
-			if result["uri"] == "http://www.yso.fi/onto/hero/": continue
-			elif result["uri"] == uri: result_type = "**Primary**:"
-			elif result.get("narrower"): result_type = "Broader:"
-			elif result.get("broader"): result_type = "Narrower:"
-			else: result_type = "Related:"
-
-			result_name = "(unknown)"
-
-			if result.get("prefLabel"):
-				for lang_label in result.get("prefLabel"):
-					if lang_label["lang"] != "en": continue
-					result_name = lang_label["value"]
-					break
-
-			en_uri = result["uri"].replace("http://www.yso.fi/onto/hero/","http://finto.fi/hero/en/page/")
-			embed.description += f"- {result_type} [{result_name}]({en_uri})\n"
+		for kind, name, uri in entries:
+			en_uri = uri.replace("http://www.yso.fi/onto/hero/","http://finto.fi/hero/en/page/")
+			embed.description += f"- {self.HERO_KINDS[kind]} [{name}]({en_uri})\n"
 
 		embed.set_footer(text = f"Term retrieved using Finto HERO.")
 		await ctx.send(embed = embed)
@@ -70,22 +53,27 @@ class HeraldryReference(utils.MeldedCog, name = "Reference", category = "Heraldr
 	)
 	@utils.trigger_typing
 	async def lookup(self, ctx, *, term : str):
-		results = await utils.get_json(self.bot.session, f"https://drawshield.net/api/define/{urllib.parse.quote(term)}")
+		#the thumbnail is optional, so a failure there shouldn't stop the definition
+		result, thumb = await asyncio.gather(
+			services.ds_define(self.bot, term),
+			services.ds_catalog(self.bot, term),
+			return_exceptions = True
+		)
 
-		if "error" in results:
+		if isinstance(result, Exception): raise result
+		elif not result:
 			raise utils.CustomCommandError(
 				"Invalid DrawShield term",
 				"The term could not be found. Check that it is entered correctly, or try other sources."
 			)
 
 		embed = embeds.SEARCH_RESULT.create(
-			f"Results for \"{term}\"",
-			f"{results['content']}\n\u200b\n[View original entry]({results['URL']})",
+			f"Results for \"{result.term}\"",
+			f"{result.content}\n\u200b\n[View original entry]({result.url})",
 		)
 		embed.set_footer(text=f"Term retrieved using DrawShield; © Karl Wilcox. ")
 
-		thumb = await services.ds_catalog(self.bot.session, term)
-		if thumb: embed.set_thumbnail(url = thumb[0])
+		if thumb and not isinstance(thumb, Exception): embed.set_thumbnail(url = thumb[0])
 
 		await ctx.send(embed = embed)
 
@@ -95,41 +83,47 @@ class HeraldryReference(utils.MeldedCog, name = "Reference", category = "Heraldr
 	)
 	@utils.trigger_typing
 	async def sbw(self, ctx, *, query):
-		title = urllib.parse.quote(query.title())
-		response = await utils.get_json(
-			self.bot.session,
-			"https://sourcedblazons.fandom.com/api.php?action=query&titles="
-			f"{title}&prop=revisions&rvslots=main&rvprop=content&rvlimit=1&format=json"
+		page = await services.sbw_resolve(self.bot, query)
+		invalid = utils.CustomCommandError(
+			"Invalid page",
+			f"The term could not be found. Check that it is entered correctly."
 		)
 
-		if response["query"]["pages"].get("-1"):
-			raise utils.CustomCommandError(
-				"Invalid page",
-				f"The term could not be found. Check that it is entered correctly."
+		if not page: raise invalid
+		elif page[1] not in self.sbw_texts:
+			response = await utils.get_json(
+				self.bot.session,
+				"https://sourcedblazons.fandom.com/api.php?action=query&redirects=1&titles="
+				f"{urllib.parse.quote(page[0])}&prop=revisions&rvslots=main&rvprop=content|ids&rvlimit=1&format=json"
 			)
 
-		def wikitext_parse(matchobj):
-			if matchobj.group(1) and "Sources" not in matchobj.group(1):
-				return f"**{matchobj.group(1)}**"
-			elif matchobj.group(2):
-				return matchobj.group(2)
-			else: return ""
-
-		response = list(response["query"]["pages"].values())[0]
-		text = re.sub(
-			self.SBW_SUB,
-			wikitext_parse,
-			response["revisions"][0]["slots"]["main"]["*"]
-		)
+			if response["query"]["pages"].get("-1"): raise invalid
+
+			response = list(response["query"]["pages"].values())[0]
+			revision = response["revisions"][0]
+			text = re.sub(self.SBW_SUB, self.wikitext_parse, revision["slots"]["main"]["*"])
 
-		if len(text) > 2048:
-			text = f"{text[:2045]}..."
+			if len(text) > 2048:
+				text = f"{text[:2045]}..."
 
-		embed = embeds.SEARCH_RESULT.create(response["title"], text, heading = "Sourced Blazons Wiki result")
-		embed.url = f"https://sourcedblazons.fandom.com/wiki/{urllib.parse.quote(response['title'])}"
+			page = (response["title"], revision["revid"])
+			self.sbw_texts[page[1]] = (response["title"], text)
+
+		title, text = self.sbw_texts[page[1]]
+
+		embed = embeds.SEARCH_RESULT.create(title, text, heading = "Sourced Blazons Wiki result")
+		embed.url = f"https://sourcedblazons.fandom.com/wiki/{urllib.parse.quote(title)}"
 
 		await ctx.send(embed = embed)
 
+	@staticmethod
+	def wikitext_parse(matchobj):
+		if matchobj.group(1) and "Sources" not in matchobj.group(1):
+			return f"**{matchobj.group(1)}**"
+		elif matchobj.group(2):
+			return matchobj.group(2)
+		else: return ""
+
 	@commands.command(
 		help = "Shows a short blurb about using supporters",
 		aliases = ("supporter",)
@@ -57,31 +57,25 @@ class HeraldryResources(utils.MeldedCog, name = "Resources", category = "Heraldr
 		aliases = ("re", "source", "resource", "r")
 	)
 	async def resources(self, ctx):
-		pages = []
-		current_size = self.PAGE_SIZE + 1
+		def resource_page(index):
+			embed = embeds.GENERIC.create(
+				"All resources", "", heading = "Heraldic resources collection"
+			)
+			embed.set_footer(
+				text = "Use the commands listed here to fetch resources individually for quick reference."
+			)
 
-		for command, name, url in self.resources:
-			if current_size > self.PAGE_SIZE:
-				embed = embeds.GENERIC.create(
-					"All resources", "", heading = "Heraldic resources collection"
-				)
-				embed.set_footer(
-					text = "Use the commands listed here to fetch resources individually for quick reference."
+			for command, name, url in self.resources[index * self.PAGE_SIZE:(index + 1) * self.PAGE_SIZE]:
+				embed.add_field(
+					name = name,
+					value = f"`{ctx.clean_prefix}{command.name}` - {command.help} [**View**]({url})",
+					inline = False
 				)
-				
-				pages.append(embed)
-				current_size = 0
-
-			embed.add_field(
-				name = name,
-				value = f"`{ctx.clean_prefix}{command.name}` - {command.help} [**View**]({url})",
-				inline = False
-			)
-			
-			current_size += 1
-			
 
-		await views.Navigator(ctx, pages).run()
+			return embed
+
+		count = -(-len(self.resources) // self.PAGE_SIZE)
+		await views.Navigator(ctx, resource_page, count).run()
 
 async def setup(bot):
 	await bot.add_cog(HeraldryResources(bot))
@@ -32,8 +32,9 @@ class HeraldryRoll(utils.MeldedCog, name = "Roll of Arms", category = "Heraldry"
 		elif user[1] == ctx.author.id:
 			embed.description += f"\n**To set an image, use `{ctx.clean_prefix}setemblazon your_url`.**"
 
-		await self.add_rolls(embed, "AND personal", user, "User roll")
-		await self.add_rolls(embed, "AND NOT personal", user, "Artist gallery")
+		rolls = await self.get_rolls(user[1])
+		self.add_rolls(embed, rolls, True, "User roll")
+		self.add_rolls(embed, rolls, False, "Artist gallery")
 		await ctx.send(embed = embed)
 
 	@commands.command(
@@ -149,13 +150,21 @@ class HeraldryRoll(utils.MeldedCog, name = "Roll of Arms", category = "Heraldry"
 		await self.bot.dbc.commit()
 		await ctx.send(":white_check_mark: | Emblazon updated.")
 
-	async def add_rolls(self, embed, query, user, name):
-		records = await self.bot.dbc.execute_fetchall(
-			f"SELECT * FROM roll_channels WHERE user_id == ? AND user_id IS NOT NULL {query};",
-			(user[1],)
+	async def get_rolls(self, user_id):
+		if user_id is None: return ()
+		channels = self.bot.get_cog("Roll Channels")
+
+		if channels and channels.rolls_loaded:
+			return tuple(channels.user_rolls.get(user_id, {}).items())
+
+		#before roll channels are prepared, both kinds still come from one query
+		return await self.bot.dbc.execute_fetchall(
+			"SELECT discord_id, personal FROM roll_channels WHERE user_id == ?;", (user_id,)
 		)
 
-		mentions = ", ".join(f"<#{record[0]}>" for record in records)
+	@staticmethod
+	def add_rolls(embed, rolls, personal, name):
+		mentions = ", ".join(f"<#{id}>" for id, is_personal in rolls if bool(is_personal) == personal)
 		if not mentions: return
 
 		embed.add_field(name = name, value = mentions)
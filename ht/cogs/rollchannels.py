@@ -1,52 +1,112 @@
-import discord, asyncio, uuid
+import discord, asyncio, time, uuid
 from discord.ext import commands, tasks
-from collections import deque
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from .. import utils
 
 class RollChannels(commands.Cog, name = "Roll Channels"):
 	VARIANTS = ["market", "artist", "roll of arms"]
+	INDEX_WORKERS = 3
+	INDEX_INTERVAL = 2
 
 	def __init__(self, bot):
 		self.bot = bot
+		self.pin_times = {}
+		self.index_queue = asyncio.Queue()
+		self.queued = set()
+		self.workers = []
+
+		self.user_rolls = defaultdict(dict)
+		self.roll_owners = {}
+		self.rolls_loaded = False
+
 		self.bot.loop.create_task(self.initialise())
 
+	def cog_unload(self):
+		for worker in self.workers:
+			worker.cancel()
+
 	async def initialise(self):
-		await self.bot.wait_until_ready()
+		await self.bot.ready_flag.wait()
+		start = time.perf_counter()
 
-		async for guild in await self.bot.dbc.execute("SELECT discord_id FROM guilds WHERE roll = 1"):
-			reified = self.bot.get_guild(guild[0])
-			if not reified: continue
+		existing = {
+			row[0]: row for row in await self.bot.dbc.execute_fetchall(
+				"SELECT discord_id, user_id, guild_id, personal, name FROM roll_channels"
+			)
+		}
+		upserts, unchanged = [], 0
 
+		for reified in filter(None, map(self.bot.get_guild, self.bot.roll_guilds)):
 			for category in reified.categories:
 				if not self.valid_category(category): continue
-				personal = self.is_personal(category)
+				personal = int(self.is_personal(category))
 
 				for channel in category.channels:
-					owner = await self.get_owner(channel)
-					await self.bot.dbc.execute(
-						"INSERT INTO roll_channels (discord_id, user_id, guild_id, personal, name) VALUES (?1, ?2, ?3, ?4, ?5)"
-						" ON CONFLICT(discord_id) DO UPDATE SET user_id = ?2, name = ?5 WHERE ?2 IS NOT NULL;",
-						(channel.id, owner, guild[0], int(personal), channel.name)
-					)
-					await self.bot.dbc.commit()
+					owner = self.get_owner(channel)
+					row = existing.get(channel.id)
+
+					#an unknown owner never replaces a known one
+					if row and (owner or row[1], channel.name) == (row[1], row[4]):
+						unchanged += 1
+						continue
+
+					upserts.append((channel.id, owner, reified.id, personal, channel.name))
+
+		removed = tuple(
+			(id,) for id, row in existing.items()
+			if (guild := self.bot.get_guild(row[2])) and not guild.get_channel(id)
+		)
+
+		await self.bot.dbc.executemany(
+			"INSERT INTO roll_channels (discord_id, user_id, guild_id, personal, name) VALUES (?1, ?2, ?3, ?4, ?5)"
+			" ON CONFLICT(discord_id) DO UPDATE SET user_id = ?2, name = ?5 WHERE ?2 IS NOT NULL;",
+			upserts
+		)
+		await self.bot.dbc.executemany("DELETE FROM roll_channels WHERE discord_id = ?;", removed)
+		await self.bot.dbc.commit()
+
+		self.bot.logger.info(
+			f"Successfully prepared roll information in {time.perf_counter() - start:.3f}s"
+			f" ({len(upserts)} updated, {len(removed)} removed, {unchanged} unchanged)."
+		)
+
+		for channel_id, owner, personal in await self.bot.dbc.execute_fetchall(
+			"SELECT discord_id, user_id, personal FROM roll_channels WHERE user_id IS NOT NULL"
+		):
+			self.cache_roll(channel_id, owner, personal)
+
+		self.rolls_loaded = True
+		self.pin_times = dict(await self.bot.dbc.execute_fetchall("SELECT * FROM roll_pins"))
 
-					if personal:
-						await self.add_emblazon(channel, owner)
+		for row in await self.bot.dbc.execute_fetchall(
+			"SELECT discord_id FROM roll_channels WHERE personal AND user_id IS NOT NULL"
+		):
+			#channels already indexed are kept current by pin events instead
+			if row[0] not in self.pin_times: self.queue_index(row[0])
 
-		self.bot.logger.info(f"Successfully prepared roll information.")
+		self.workers = [
+			self.bot.loop.create_task(self.index_pins()) for _ in range(self.INDEX_WORKERS)
+		]
 
 	@commands.Cog.listener()
 	async def on_guild_channel_update(self, before, after):
 		if not isinstance(after, discord.TextChannel) or not self.valid_category(after.category):
 			return
 
-		if before.overwrites.items() != after.overwrites.items():
-			await self.bot.dbc.execute(
-				"UPDATE roll_channels SET user_id = ?1 WHERE discord_id = ?2;",
-				(await self.get_owner(after), after.id)
-			)
-			await self.bot.dbc.commit()
+		owner = self.get_owner(after)
+
+		if before.category == after.category and before.name == after.name and owner == self.get_owner(before):
+			return #only overwrites that decide ownership matter
+
+		await self.bot.dbc.execute(
+			"INSERT INTO roll_channels (discord_id, user_id, guild_id, personal, name) VALUES (?1, ?2, ?3, ?4, ?5)"
+			" ON CONFLICT(discord_id) DO UPDATE SET user_id = ?2, personal = ?4, name = ?5;",
+			(after.id, owner, after.guild.id, int(self.is_personal(after.category)), after.name)
+		)
+		await self.bot.dbc.commit()
+
+		self.cache_roll(after.id, owner, self.is_personal(after.category))
 
 	@commands.Cog.listener()
 	async def on_guild_channel_create(self, channel):
@@ -55,44 +115,98 @@ class RollChannels(commands.Cog, name = "Roll Channels"):
 
 		await self.bot.dbc.execute(
 			"INSERT INTO roll_channels (discord_id, user_id, guild_id, personal, name) VALUES (?1, ?2, ?3, ?4, ?5);",
-			(channel.id, await self.get_owner(channel), channel.guild.id, self.is_personal(channel.category), channel.name)
+			(channel.id, self.get_owner(channel), channel.guild.id, int(self.is_personal(channel.category)), channel.name)
 		)
 		await self.bot.dbc.commit()
 
+		self.cache_roll(channel.id, self.get_owner(channel), self.is_personal(channel.category))
+
 	@commands.Cog.listener()
 	async def on_guild_channel_delete(self, channel):
 		await self.bot.dbc.execute(
 			"DELETE FROM roll_channels WHERE discord_id = ?;", (channel.id,)
 		)
+		await self.bot.dbc.execute("DELETE FROM roll_pins WHERE channel_id = ?;", (channel.id,))
 		await self.bot.dbc.commit()
 
-	async def add_emblazon(self, channel, owner):
-		if await self.bot.dbc.execute_fetchone("SELECT * FROM emblazons WHERE id == ?", (owner,)):
-			return #has emblazon
+		self.pin_times.pop(channel.id, None)
+		self.cache_roll(channel.id, None, False)
+
+	def cache_roll(self, channel_id, owner, personal):
+		if (previous := self.roll_owners.pop(channel_id, None)) is not None:
+			self.user_rolls[previous].pop(channel_id, None)
+			if not self.user_rolls[previous]: del self.user_rolls[previous]
+
+		if owner is None: return
+
+		self.roll_owners[channel_id] = owner
+		self.user_rolls[owner][channel_id] = bool(personal)
+
+	@commands.Cog.listener()
+	async def on_guild_channel_pins_update(self, channel, last_pin):
+		if not last_pin or not self.valid_category(channel.category) or not self.is_personal(channel.category):
+			return
+
+		#unpinning reports the remaining newest pin, which has already been seen
+		if last_pin.timestamp() > self.pin_times.get(channel.id, 0):
+			self.queue_index(channel.id)
 
-		pinned = list(filter(
-			lambda p: len(p.attachments) > 0, await channel.pins()
-		)).reverse()
+	def queue_index(self, channel_id):
+		if channel_id in self.queued: return
 
-		if not pinned or not owner: return
+		self.queued.add(channel_id)
+		self.index_queue.put_nowait(channel_id)
+
+	async def index_pins(self):
+		while True:
+			channel_id = await self.index_queue.get()
+			self.queued.discard(channel_id)
+
+			try:
+				await self.add_emblazon(channel_id)
+			except discord.HTTPException as error:
+				self.bot.logger.warning(f"Could not index pins in {channel_id}: {error}")
+
+			await asyncio.sleep(self.INDEX_INTERVAL)
+
+	async def add_emblazon(self, channel_id):
+		channel = self.bot.get_channel(channel_id)
+		row = await self.bot.dbc.execute_fetchone(
+			"SELECT user_id, emblazons.id FROM roll_channels LEFT JOIN emblazons ON user_id = emblazons.id"
+			" WHERE discord_id = ? AND personal;",
+			(channel_id,)
+		)
+
+		if not channel or not row or not row[0]: return
+		indexed = time.time()
+
+		if not row[1]:
+			#no emblazon set or removed yet; the oldest pinned image is most likely to be the arms themselves
+			pinned = [p for p in reversed(await channel.pins()) if len(p.attachments) > 0]
+
+			if pinned: await self.bot.dbc.execute(
+				"INSERT INTO emblazons (id, url) VALUES (?1, ?2) ON CONFLICT DO NOTHING;",
+				(row[0], pinned[0].attachments[0].url)
+			)
 
 		await self.bot.dbc.execute(
-			"INSERT INTO emblazons (id, url) VALUES (?1, ?2) ON CONFLICT DO NOTHING;",
-			(owner, url)
+			"INSERT INTO roll_pins (channel_id, last_pin) VALUES (?1, ?2)"
+			" ON CONFLICT(channel_id) DO UPDATE SET last_pin = ?2;",
+			(channel_id, indexed)
 		)
 		await self.bot.dbc.commit()
 
+		self.pin_times[channel_id] = indexed
+
 	@staticmethod
-	async def get_owner(channel):
+	def get_owner(channel):
 		for member, overwrite in channel.overwrites.items():
 			if isinstance(member, discord.Role): continue
 			elif overwrite.pair()[0].manage_channels: return member.id
 		return None
 
 	def valid_category(self, category):
-		if category.guild.id not in {
-			id: g[0] for (id, g) in self.bot.guild_cache.items() if g[1][3]
-		}:
+		if not category or category.guild.id not in self.bot.roll_guilds:
 			return False
 
 		name = category.name.lower()
@@ -1,8 +1,8 @@
-import discord, urllib, time, re, random, os
+import discord, aiohttp, asyncio, urllib, time, re, random, os
 from docx2python import docx2python
 from datetime import datetime, timezone
 from discord.ext import commands, tasks
-from .. import utils, embeds
+from .. import services, utils, embeds
 
 class BotTasks(commands.Cog, name = "Bot tasks"):
 	STRIP_SPACES = re.compile(r"\n[\t\s]+")
@@ -31,6 +31,8 @@ class BotTasks(commands.Cog, name = "Bot tasks"):
 		self.bot = bot
 		self.update_info.start()
 		self.sync_book.start()
+		self.sync_hero.start()
+		self.sync_sbw.start()
 
 		if not os.path.isdir("data/book"):
 			os.mkdir("data/book")
@@ -38,6 +40,8 @@ class BotTasks(commands.Cog, name = "Bot tasks"):
 	def cog_unload(self):
 		self.update_info.stop()
 		self.sync_book.stop()
+		self.sync_hero.stop()
+		self.sync_sbw.stop()
 
 	@tasks.loop(hours = 12)
 	async def update_info(self):
@@ -99,6 +103,24 @@ class BotTasks(commands.Cog, name = "Bot tasks"):
 				
 		return entries	
 
+	@tasks.loop(hours = 24)
+	async def sync_hero(self):
+		#mirror the whole vocabulary so that !hero works locally, and through finto outages
+		try:
+			count = await services.hero_sync(self.bot)
+		except (aiohttp.ClientError, asyncio.TimeoutError):
+			self.bot.logger.warning("Could not mirror the HERO vocabulary; keeping the existing copy")
+			return
+
+		self.bot.logger.info(f"Mirrored {count} HERO terms.")
+
+	@tasks.loop(hours = 1)
+	async def sync_sbw(self):
+		try:
+			await services.sbw_sync(self.bot)
+		except (aiohttp.ClientError, asyncio.TimeoutError):
+			self.bot.logger.warning("Could not update the Sourced Blazons Wiki index")
+
 	@tasks.loop(hours = 10)
 	async def sync_book(self):
 		response = await utils.get_json(
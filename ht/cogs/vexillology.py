@@ -23,7 +23,7 @@ class VexStuff(utils.MeldedCog, name = "Vexillology", category = "Vexillology"):
 	)
 	@utils.trigger_typing
 	async def drawflag(self, ctx, *, blazon : str):
-		embed, file = await services.ds(self.bot.session, blazon + " in flag shape", "Flag")
+		embed, file = await services.ds(self.bot, blazon + " in flag shape", "Flag")
 		await ctx.send(embed = embed, file = file)
 
 	@commands.command(
@@ -13,5 +13,76 @@ class NvConnection(aiosqlite.Connection):
 		await self.execute(f"UPDATE misc_store SET value = ? WHERE key = ?;", (value, key))
 		await self.commit()
 
+class Record:
+	#a mutable, slotted alternative to row tuples, so cached rows can be read by name
+	__slots__ = ()
+
+	def __init__(self, *values):
+		for slot, value in zip(self.__slots__, values):
+			setattr(self, slot, value)
+
+	def __repr__(self):
+		values = ", ".join(f"{slot} = {getattr(self, slot, None)!r}" for slot in self.__slots__)
+		return f"{type(self).__name__}({values})"
+
+class GuildRecord(Record):
+	__slots__ = (
+		"discord_id", "name", "limit_commands", "roll", "welcome_users",
+		"welcome_text", "leave_text", "log", "guild"
+	)
+
+class ChannelRecord(Record):
+	__slots__ = ("discord_id", "guild", "proposal", "oc")
+
+class ProposalRecord(Record):
+	__slots__ = ("discord_id", "channel_id", "author", "author_avatar", "content", "reactions")
+
+	@classmethod
+	def from_message(cls, message):
+		return cls(
+			message.id,
+			message.channel.id,
+			str(message.author),
+			message.author.display_avatar.with_size(256).url,
+			message.content,
+			{str(reaction.emoji): reaction.count for reaction in message.reactions}
+		)
+
+class RecordCache(dict):
+	#notifies dependent caches when a record is added, patched in place or removed
+	def __init__(self):
+		super().__init__()
+		self.listeners = []
+
+	def listen(self, callback):
+		self.listeners.append(callback)
+		return callback
+
+	def unlisten(self, callback):
+		if callback in self.listeners:
+			self.listeners.remove(callback)
+
+	def notify(self, record, removed = False):
+		for callback in self.listeners:
+			callback(record, removed)
+
+	def add(self, record):
+		self[record.discord_id] = record
+		self.notify(record)
+		return record
+
+	def patch(self, key, **changes):
+		if not (record := self.get(key)): return None
+
+		for name, value in changes.items():
+			setattr(record, name, value)
+
+		self.notify(record)
+		return record
+
+	def discard(self, key):
+		if record := self.pop(key, None):
+			self.notify(record, removed = True)
+
 def connect(database, *, iter_chunk_size = 64, **kwargs):
 	return NvConnection(lambda: sqlite3.connect(database, **kwargs), iter_chunk_size)
@@ -78,7 +78,13 @@ class SlowTCPConnector(aiohttp.connector.TCPConnector):
 		self._factory = functools.partial(_SlowResponseHandler, loop = kwargs["loop"])
 
 	@staticmethod
-	def get_slow_session(**kwargs):
+	def get_slow_session(keepalive_timeout = 60, ttl_dns_cache = 300, **kwargs):
 		#a horrendous workaround to stop aiohttp breaking on a perfectly fine http request
 		#basically replaces HttpResponseParser with its Python fallback
-		return aiohttp.ClientSession(connector = SlowTCPConnector(loop = asyncio.get_running_loop()), **kwargs)
+		#the session is meant to be long-lived, so connections and dns lookups are reused
+		connector = SlowTCPConnector(
+			loop = asyncio.get_running_loop(),
+			keepalive_timeout = keepalive_timeout,
+			ttl_dns_cache = ttl_dns_cache
+		)
+		return aiohttp.ClientSession(connector = connector, **kwargs)
@@ -0,0 +1,166 @@
+import discord, asyncio, heapq, itertools, json, time
+
+class Scheduler:
+	#one task for every timed action, backed by a heap and persisted so that actions survive restarts
+	def __init__(self, bot):
+		self.bot = bot
+		self.actions = {}
+		self.entries = {}
+		self.heap = []
+		self.counter = itertools.count()
+		self.wakeup = asyncio.Event()
+		self.task = None
+
+	def register(self, action, callback):
+		self.actions[action] = callback
+
+	def unregister(self, action):
+		self.actions.pop(action, None)
+
+	def due(self, key):
+		entry = self.entries.get(key)
+		return entry[0] if entry else None
+
+	async def load(self):
+		for key, action, due, data in await self.bot.dbc.execute_fetchall(
+			"SELECT key, action, due, data FROM scheduled_actions"
+		):
+			self.push(key, action, due, json.loads(data))
+
+	def push(self, key, action, due, data):
+		#replaced entries stay in the heap, but are skipped as they no longer match
+		entry = (due, next(self.counter), key, action, data)
+		self.entries[key] = entry
+
+		heapq.heappush(self.heap, entry)
+		self.wakeup.set()
+
+	async def schedule(self, key, action, due, data = None):
+		data = data or {}
+		self.push(key, action, due, data)
+
+		await self.bot.dbc.execute(
+			"INSERT INTO scheduled_actions (key, action, due, data) VALUES (?1, ?2, ?3, ?4)"
+			" ON CONFLICT(key) DO UPDATE SET action = ?2, due = ?3, data = ?4;",
+			(key, action, due, json.dumps(data))
+		)
+		await self.bot.dbc.commit()
+
+	async def cancel(self, key):
+		if not self.entries.pop(key, None): return False
+
+		await self.bot.dbc.execute("DELETE FROM scheduled_actions WHERE key = ?;", (key,))
+		await self.bot.dbc.commit()
+		return True
+
+	def start(self):
+		if not self.task:
+			self.task = asyncio.create_task(self.run())
+
+	def stop(self):
+		if self.task:
+			self.task.cancel()
+			self.task = None
+
+	async def run(self):
+		await self.bot.wait_until_ready()
+
+		while True:
+			self.wakeup.clear()
+
+			while self.heap and self.entries.get(self.heap[0][2]) is not self.heap[0]:
+				heapq.heappop(self.heap)
+
+			if not self.heap:
+				await self.wakeup.wait()
+				continue
+
+			delay = self.heap[0][0] - time.time()
+
+			if delay > 0:
+				try: await asyncio.wait_for(self.wakeup.wait(), delay)
+				except asyncio.TimeoutError: pass
+				continue
+
+			entry = heapq.heappop(self.heap)
+			del self.entries[entry[2]]
+			asyncio.create_task(self.fire(entry))
+
+	async def fire(self, entry):
+		due, _, key, action, data = entry
+
+		try:
+			if callback := self.actions.get(action):
+				await callback(data)
+			else:
+				self.bot.logger.warning(f"No scheduled action named \"{action}\" for {key}.")
+		except Exception:
+			await self.bot.on_error("scheduler", key)
+
+		#matching on due time keeps anything the callback rescheduled
+		await self.bot.dbc.execute(
+			"DELETE FROM scheduled_actions WHERE key = ?1 AND due = ?2;", (key, due)
+		)
+		await self.bot.dbc.commit()
+
+class EditQueue:
+	#coalesces message edits so only the latest for each message is sent, paced per channel and overall
+	CHANNEL_INTERVAL = 1.2
+	GLOBAL_INTERVAL = 0.1
+
+	def __init__(self, bot):
+		self.bot = bot
+		self.pending = {}
+		self.last_edit = {}
+		self.wakeup = asyncio.Event()
+		self.task = None
+
+	def submit(self, channel_id, message_id, missing = None, **kwargs):
+		#reassigning a key keeps its place, so a busy message can't starve the others
+		self.pending[(channel_id, message_id)] = (kwargs, missing)
+		self.wakeup.set()
+
+		if not self.task or self.task.done():
+			self.task = asyncio.create_task(self.run())
+
+	def stop(self):
+		if self.task:
+			self.task.cancel()
+			self.task = None
+
+	async def run(self):
+		while True:
+			self.wakeup.clear()
+
+			if not self.pending:
+				await self.wakeup.wait()
+				continue
+
+			now = time.monotonic()
+			available = lambda key: self.last_edit.get(key[0], 0) + self.CHANNEL_INTERVAL
+			key = min(self.pending, key = available)
+
+			if (delay := available(key) - now) > 0:
+				await asyncio.sleep(delay)
+				continue
+
+			kwargs, missing = self.pending.pop(key)
+			self.last_edit[key[0]] = now
+			message = self.bot.get_partial_messageable(key[0]).get_partial_message(key[1])
+
+			try:
+				await message.edit(**kwargs)
+			except discord.NotFound:
+				if missing: await missing()
+			except discord.HTTPException as error:
+				self.bot.logger.warning(f"Could not edit message {key[1]}: {error}")
+			except Exception:
+				#anything else (e.g. a dropped connection) must not stop the queue for good
+				await self.bot.on_error("edit queue", key)
+
+			if len(self.last_edit) > len(self.pending) + 100:
+				self.last_edit = {
+					c: t for c, t in self.last_edit.items() if t + self.CHANNEL_INTERVAL > now
+				}
+
+			await asyncio.sleep(self.GLOBAL_INTERVAL)
@@ -1,19 +1,83 @@
-import discord, asyncio, urllib, io, base64, itertools
-from xml.etree import ElementTree
-from . import embeds, utils, views
+import discord, aiohttp, asyncio, urllib, io, base64, difflib, itertools, json, time
+from datetime import datetime, timezone
+from dateutil.tz import gettz
+from collections import namedtuple
+from . import caches, embeds, utils, views
 
-async def gis(ctx, query):
+OPTIONS_TTL = 86400
+COMMONS_BATCH = 50
+DS_REFRESH = 2592000
+HERO_TTL = 86400
+HERO_ROOT = "http://www.yso.fi/onto/hero/"
+SBW_API = "https://sourcedblazons.fandom.com/api.php"
+SBW_REBUILD = 604800
+GIS_MARGIN = 0.9
+GIS_LIMIT = 100
+PACIFIC = gettz("America/Los_Angeles")
+
+CommonsFile = namedtuple("CommonsFile", ("title", "description", "url", "thumbnail"))
+DrawShieldTerm = namedtuple("DrawShieldTerm", ("term", "content", "url"))
+commons_files = caches.LRUCache(2000)
+term_names = {}
+
+async def gis_usage(bot):
+	#the custom search quota resets at midnight pacific time
+	today = datetime.now(PACIFIC).date().isoformat()
+
+	cursor = await bot.dbc.execute(
+		"UPDATE misc_store SET value = ?1 WHERE key = 'gis_quota_day' AND value != ?1;", (today,)
+	)
+	if cursor.rowcount: await bot.dbc.store_set("gis_quota_used", 0)
+
+	return int(await bot.dbc.store_get("gis_quota_used"))
+
+async def gis_search(bot, query, start = 1):
 	IMAGE_NUM = 10
+	key = " ".join(query.casefold().split())
+	row = await bot.dbc.execute_fetchone(
+		"SELECT results, fetched FROM gis_cache WHERE query = ? AND start = ?;", (key, start)
+	)
+	used = await gis_usage(bot)
+	quota = bot.conf["GIS_DAILY_QUOTA"]
+
+	if row and (time.time() - row[1] < bot.conf["GIS_CACHE_TTL"] or used >= quota * GIS_MARGIN):
+		return json.loads(row[0])
+
+	#reserve the query atomically before making it, so concurrent searches can't overspend
+	cursor = await bot.dbc.execute(
+		"UPDATE misc_store SET value = CAST(value AS INTEGER) + 1"
+		" WHERE key = 'gis_quota_used' AND CAST(value AS INTEGER) < ?;", (quota,)
+	)
+	await bot.dbc.commit()
+
+	if not cursor.rowcount: raise utils.CustomCommandError(
+		"Search quota exhausted",
+		"The daily image search quota has been used up, and this search isn't cached. Try again tomorrow."
+	)
+
 	params = urllib.parse.urlencode({
-		"key": ctx.bot.conf["GCS_TOKEN"],
+		"key": bot.conf["GCS_TOKEN"],
 		"q": query,
-		"cx": ctx.bot.conf["GCS_CX"],
+		"cx": bot.conf["GCS_CX"],
 		"searchType": "image",
 		"safe": "off",
-		"num": IMAGE_NUM
+		"num": IMAGE_NUM,
+		"start": start
 	})
 
-	search = await utils.get_json(ctx.bot.session, f"https://www.googleapis.com/customsearch/v1?{params}")
+	search = await utils.get_json(bot.session, f"https://www.googleapis.com/customsearch/v1?{params}")
+
+	if search and "error" not in search:
+		await bot.dbc.execute(
+			"INSERT OR REPLACE INTO gis_cache (query, start, results, fetched) VALUES (?, ?, ?, ?);",
+			(key, start, json.dumps(search), time.time())
+		)
+		await bot.dbc.commit()
+
+	return search
+
+async def gis(ctx, query):
+	search = await gis_search(ctx.bot, query)
 
 	if search == None: raise utils.CustomCommandError(
 		"Invalid HTTP search request",
@@ -25,7 +89,10 @@ async def gis(ctx, query):
 		"The search returned no images. Check that what you are looking for exists."
 	)
 
-	def image_result(item):
+	results = [(item, search) for item in search["items"]]
+
+	def image_result(index):
+		item, page = results[index]
 		url = discord.utils.escape_markdown(item["image"]["contextLink"])
 		embed = embeds.SEARCH_RESULT.create(
 			f"Results for \"{query}\"",
@@ -35,17 +102,41 @@ async def gis(ctx, query):
 		embed.set_image(url = item["link"])
 		embed.set_footer(
 			text = "Search conducted using the Google Custom Search API "
-				  f"in {search['searchInformation']['formattedSearchTime']}s."
+				  f"in {page['searchInformation']['formattedSearchTime']}s."
 		)
 		return embed
 
-	pages = tuple(image_result(page) for page in search["items"])
-	await views.Navigator(ctx, pages).run()
+	async def next_results():
+		#only fetched once the user reaches the end, as each further page costs quota
+		last = results[-1][1]
+		start = last.get("queries", {}).get("nextPage", [{}])[0].get("startIndex")
+		if not start or start > GIS_LIMIT: return 0
+
+		try:
+			more = await gis_search(ctx.bot, query, start)
+		except utils.CustomCommandError:
+			return 0
+
+		if not more or not more.get("items"): return 0
+
+		results.extend((item, more) for item in more["items"])
+		return len(more["items"])
 
-async def ds(session, blazon, drawn_kind):
-	blazon_out = urllib.parse.quote(blazon)
-	results = await utils.get_json(session, f"https://drawshield.net/include/drawshield.php?blazon={blazon_out}&outputformat=json")
-	image = discord.File(io.BytesIO(base64.b64decode(results["image"])), filename = "ds.png")
+	await views.Navigator(ctx, image_result, len(results), next_results).run()
+
+async def ds(bot, blazon, drawn_kind):
+	key = bot.renders.key("drawshield", (), blazon)
+
+	if cached := await bot.renders.get(key):
+		messages, image_data = cached
+	else:
+		blazon_out = urllib.parse.quote(blazon)
+		results = await utils.get_json(bot.session, f"https://drawshield.net/include/drawshield.php?blazon={blazon_out}&outputformat=json")
+		image_data = await bot.loop.run_in_executor(None, base64.b64decode, results["image"])
+		messages = results["messages"]
+		await bot.renders.put(key, messages, image_data)
+
+	image = discord.File(io.BytesIO(image_data), filename = "ds.png")
 
 	embed = embeds.DRAW.create("", f"*{blazon}*", heading = f"{drawn_kind} drawn!")
 	embed.set_image(url = "attachment://ds.png")
@@ -54,7 +145,7 @@ async def ds(session, blazon, drawn_kind):
 		text = f"Not all blazons can be illustrated with this command.\nDrawn using DrawShield; © Karl Wilcox."
 	)
 
-	for message in results["messages"]:
+	for message in messages:
 		if message["category"] != "blazon": continue
 		elif "linerange" in message:
 			embed.add_field(name = f"Error {message['linerange'].strip()}", value = message["content"], inline = False)
@@ -63,20 +154,270 @@ async def ds(session, blazon, drawn_kind):
 
 	return embed, image
 
-async def ds_catalog(session, charge):
-	catalog = await utils.get_json(session, f"https://drawshield.net/api/catalog/{urllib.parse.quote(charge)}")
+async def ds_define(bot, term):
+	#drawshield has no bulk export, so entries are mirrored locally as they are looked up
+	row = await bot.dbc.execute_fetchone("SELECT term, content, url, fetched FROM ds_terms WHERE term = ?", (term,))
+	if row and time.time() - row[3] < DS_REFRESH: return DrawShieldTerm(*row[:3])
+
+	try:
+		result = await utils.get_json(bot.session, f"https://drawshield.net/api/define/{urllib.parse.quote(term)}")
+	except (aiohttp.ClientError, asyncio.TimeoutError):
+		if row: return DrawShieldTerm(*row[:3])
+
+		#drawshield is down, so the closest known term is better than nothing
+		if match := await closest_term(bot, "ds_terms", "term", term):
+			row = await bot.dbc.execute_fetchone("SELECT term, content, url FROM ds_terms WHERE term = ?", (match,))
+			return DrawShieldTerm(*row)
+		raise
+
+	if "error" in result: return None
+
+	await bot.dbc.execute(
+		"INSERT INTO ds_terms (term, content, url, fetched) VALUES (?1, ?2, ?3, ?4)"
+		" ON CONFLICT(term) DO UPDATE SET content = ?2, url = ?3, fetched = ?4;",
+		(term, result["content"], result["URL"], time.time())
+	)
+	await bot.dbc.commit()
+	term_names.pop(("ds_terms", "term"), None)
+
+	return DrawShieldTerm(term, result["content"], result["URL"])
+
+async def ds_catalog(bot, charge):
+	row = await bot.dbc.execute_fetchone("SELECT entry, fetched FROM ds_catalog WHERE charge = ?", (charge,))
+
+	if row and time.time() - row[1] < DS_REFRESH:
+		catalog = row[0]
+	else:
+		try:
+			catalog = await utils.get_json(bot.session, f"https://drawshield.net/api/catalog/{urllib.parse.quote(charge)}")
+		except (aiohttp.ClientError, asyncio.TimeoutError):
+			if not row: raise
+			catalog = row[0]
+		else:
+			#misses are stored too, as most terms have no catalog entry
+			await bot.dbc.execute(
+				"INSERT INTO ds_catalog (charge, entry, fetched) VALUES (?1, ?2, ?3)"
+				" ON CONFLICT(charge) DO UPDATE SET entry = ?2, fetched = ?3;",
+				(charge, catalog, time.time())
+			)
+			await bot.dbc.commit()
 
 	if not catalog.startswith("http"): return None
 	return catalog.split("\n")
 
-async def commons(session, loop, filename):
-	result_text = await utils.get_text(
-		session,
-		f"https://magnus-toolserver.toolforge.org/commonsapi.php?image={filename}&thumbwidth=600&thumbheight=600&meta"
+async def find_row(bot, table, column, columns, term):
+	#exact match first, then the shortest prefix match, then the closest fuzzy match
+	query = f"SELECT {columns} FROM {table} WHERE {column}"
+	row = await bot.dbc.execute_fetchone(f"{query} = ?", (term,))
+
+	if not row:
+		prefix = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+		row = await bot.dbc.execute_fetchone(
+			f"{query} LIKE ? ESCAPE '\\' ORDER BY length({column}) LIMIT 1;", (f"{prefix}%",)
+		)
+
+	if not row and (match := await closest_term(bot, table, column, term)):
+		row = await bot.dbc.execute_fetchone(f"{query} = ?", (match,))
+
+	return row
+
+async def load_terms(bot, table, column):
+	#replaced wholesale rather than mutated, as matching reads it from another thread
+	rows = await bot.dbc.execute_fetchall(f"SELECT {column} FROM {table}")
+	term_names[(table, column)] = {row[0].casefold(): row[0] for row in rows}
+
+async def closest_term(bot, table, column, query):
+	if (table, column) not in term_names: await load_terms(bot, table, column)
+
+	names = term_names[(table, column)]
+	match = await bot.loop.run_in_executor(None, difflib.get_close_matches, query.casefold(), names, 1, 0.8)
+	return names[match[0]] if match else None
+
+def as_list(value):
+	if value is None: return []
+	return value if isinstance(value, list) else [value]
+
+def english_label(node):
+	return next((label["value"] for label in as_list(node.get("prefLabel")) if label["lang"] == "en"), None)
+
+def parse_hero(graph):
+	terms = {}
+
+	for node in graph:
+		label = english_label(node)
+		if node["uri"] == HERO_ROOT or not node["uri"].startswith(HERO_ROOT) or not label: continue
+
+		links = [{n["uri"] if isinstance(n, dict) else n for n in as_list(node.get(k))} for k in ("broader", "narrower", "related")]
+		terms[node["uri"]] = (label, *links)
+
+	#the export may only state one direction of each hierarchy link
+	for uri, (_, broader, narrower, _) in terms.items():
+		for parent in broader:
+			if parent in terms: terms[parent][2].add(uri)
+		for child in narrower:
+			if child in terms: terms[child][1].add(uri)
+
+	return [(uri, label, *(json.dumps(sorted(l)) for l in links)) for uri, (label, *links) in terms.items()]
+
+async def hero_sync(bot):
+	vocab = await utils.get_json(bot.session, "http://api.finto.fi/rest/v1/hero/data?format=application%2Fjson")
+	terms = await bot.loop.run_in_executor(None, parse_hero, vocab["graph"])
+
+	if not terms: return 0
+
+	await bot.dbc.execute("DELETE FROM hero_terms;")
+	await bot.dbc.executemany(
+		"INSERT INTO hero_terms (uri, label, broader, narrower, related) VALUES (?, ?, ?, ?, ?);", terms
+	)
+	await bot.dbc.commit()
+	await load_terms(bot, "hero_terms", "label")
+
+	return len(terms)
+
+async def hero_local(bot, term):
+	row = await find_row(bot, "hero_terms", "label", "uri, label, broader, narrower, related", term)
+	if not row: return None
+
+	uri, label, *links = row
+	links = dict(zip(("broader", "narrower", "related"), (json.loads(l) for l in links)))
+	linked = [u for uris in links.values() for u in uris]
+
+	labels = dict(await bot.dbc.execute_fetchall(
+		f"SELECT uri, label FROM hero_terms WHERE uri IN ({','.join(['?'] * len(linked))})", linked
+	))
+
+	return [("primary", label, uri)] + [
+		(kind, labels.get(u, "(unknown)"), u) for kind, uris in links.items() for u in uris
+	]
+
+async def hero_live(bot, term):
+	query = await utils.get_json(
+		bot.session,
+		f"http://api.finto.fi/rest/v1/search?vocab=hero&query={urllib.parse.quote(term)}&lang=en",
+		ttl = HERO_TTL
+	)
+
+	if len(query["results"]) == 0: return None
+
+	uri = query["results"][0]["uri"]
+	results = await utils.get_json(
+		bot.session,
+		f"http://api.finto.fi/rest/v1/hero/data?format=application%2Fjson&uri={urllib.parse.quote(uri)}&lang=en",
+		ttl = HERO_TTL
 	)
-	get_json = lambda text_string, root: ElementTree.fromstring(text_string).find(root)
+	entries = []
+
+	for result in results["graph"]:
+		if result["uri"] == HERO_ROOT: continue
+		elif result["uri"] == uri: kind = "primary"
+		elif result.get("narrower"): kind = "broader"
+		elif result.get("broader"): kind = "narrower"
+		else: kind = "related"
+
+		entries.append((kind, english_label(result) or "(unknown)", result["uri"]))
+
+	return entries
+
+async def commons(session, *filenames):
+	#resolves files through imageinfo, up to 50 per request, and returns None for missing ones
+	missing = [name for name in dict.fromkeys(filenames) if name not in commons_files]
+
+	for start in range(0, len(missing), COMMONS_BATCH):
+		batch = missing[start:start + COMMONS_BATCH]
+		params = urllib.parse.urlencode({
+			"action": "query",
+			"prop": "imageinfo",
+			"iiprop": "url",
+			"iiurlwidth": 600,
+			"titles": "|".join(f"File:{name}" for name in batch),
+			"format": "json"
+		})
+		result = await utils.get_json(session, f"https://commons.wikimedia.org/w/api.php?{params}")
 
-	return await loop.run_in_executor(None, get_json, result_text, "file")
+		#titles are returned normalised, so map them back to the names that were asked for
+		names = {entry["to"]: entry["from"] for entry in result["query"].get("normalized", ())}
+
+		for page in result["query"]["pages"].values():
+			if not page.get("imageinfo"): continue
+
+			info = page["imageinfo"][0]
+			name = names.get(page["title"], page["title"]).removeprefix("File:")
+			commons_files[name] = CommonsFile(
+				page["title"].removeprefix("File:"),
+				info["descriptionurl"],
+				info["url"],
+				info.get("thumburl", info["url"])
+			)
+
+	return [commons_files.get(name) for name in filenames]
+
+async def mediawiki_query(session, api, **params):
+	#follows query continuation, yielding each batch of results
+	params = {"action": "query", "format": "json", **params}
+
+	while True:
+		result = await utils.get_json(session, f"{api}?{urllib.parse.urlencode(params)}")
+		yield result.get("query", {})
+
+		if "continue" not in result: break
+		params.update(result["continue"])
+
+async def sbw_sync(bot):
+	#the index is rebuilt weekly, and kept current in between using recent changes
+	started = time.time()
+
+	if started - float(await bot.dbc.store_get("sbw_rebuilt")) > SBW_REBUILD:
+		pages = []
+
+		async for batch in mediawiki_query(
+			bot.session, SBW_API, generator = "allpages", gapnamespace = 0, gaplimit = "max", prop = "info"
+		):
+			pages.extend((page["title"], page["lastrevid"]) for page in batch.get("pages", {}).values())
+
+		await bot.dbc.execute("DELETE FROM sbw_pages;")
+		await bot.dbc.executemany("INSERT OR REPLACE INTO sbw_pages (title, revid) VALUES (?, ?);", pages)
+		await bot.dbc.store_set("sbw_rebuilt", started)
+		await bot.dbc.store_set("sbw_timestamp", started)
+		await load_terms(bot, "sbw_pages", "title")
+		return len(pages)
+
+	since = datetime.fromtimestamp(float(await bot.dbc.store_get("sbw_timestamp")), timezone.utc)
+	changes = 0
+
+	async for batch in mediawiki_query(
+		bot.session, SBW_API, list = "recentchanges", rcnamespace = 0, rcdir = "newer",
+		rcstart = since.strftime("%Y-%m-%dT%H:%M:%SZ"), rcprop = "title|ids|loginfo",
+		rctype = "new|edit|log", rclimit = "max"
+	):
+		for change in batch.get("recentchanges", ()):
+			changes += 1
+
+			if change["type"] in ("new", "edit"):
+				await bot.dbc.execute(
+					"INSERT OR REPLACE INTO sbw_pages (title, revid) VALUES (?, ?);",
+					(change["title"], change["revid"])
+				)
+			elif change.get("logtype") == "delete" and change.get("logaction") == "delete":
+				await bot.dbc.execute("DELETE FROM sbw_pages WHERE title = ?;", (change["title"],))
+			elif change.get("logtype") == "move" and "target_title" in change.get("logparams", {}):
+				#the old title usually stays as a redirect, so only the new one is added
+				await bot.dbc.execute(
+					"INSERT OR IGNORE INTO sbw_pages (title) VALUES (?);", (change["logparams"]["target_title"],)
+				)
+
+	await bot.dbc.store_set("sbw_timestamp", started)
+	if changes: await load_terms(bot, "sbw_pages", "title")
+	return changes
+
+async def sbw_resolve(bot, query):
+	query = " ".join(query.replace("_", " ").split())
+	row = await find_row(bot, "sbw_pages", "title", "title, revid", query)
+
+	if row: return row
+	elif not await bot.dbc.execute_fetchone("SELECT 1 FROM sbw_pages LIMIT 1;"):
+		return query.title(), None #index not built yet, so try the title directly
+
+	return None
 
 def is_option_keyword(s):
 	return s.startswith(":") or s.startswith("+")
@@ -88,24 +429,34 @@ def parse_options_and_blazon(query):
 	return options, blazon
 
 
-async def heraldicon(session, query):
+async def heraldicon(bot, query):
 	options, blazon = parse_options_and_blazon(query)
-	result = await utils.post_json(session, "https://2f1yb829vl.execute-api.eu-central-1.amazonaws.com/api",
-		{
-			"call": "generate-from-blazon",
-			"data": {
-				"blazon": blazon,
-				"options": options,
-			},
-		}
-	)
+	key = bot.renders.key("heraldicon", options, blazon)
+
+	if cached := await bot.renders.get(key):
+		result, image_data = cached
+	else:
+		result = await utils.post_json(bot.session, "https://2f1yb829vl.execute-api.eu-central-1.amazonaws.com/api",
+			{
+				"call": "generate-from-blazon",
+				"data": {
+					"blazon": blazon,
+					"options": options,
+				},
+			}
+		)
+		image_data = b""
+
+		if result.get("success"):
+			image_data = (await utils.get_bytes(bot.session, result["success"]["png-url"])).getvalue()
+		if result.get("success") or result.get("error"):
+			await bot.renders.put(key, result, image_data)
+
 	success = result.get("success")
 	if success:
-		png_url = success["png-url"]
 		edit_link = f"[Edit on Heraldicon]({success['edit-url']})"
 		embed = embeds.DRAW.create("", edit_link, heading = "Shield created!")
-		image_data = await utils.get_bytes(session, png_url)
-		image = discord.File(image_data, filename = "heraldicon-arms.png")
+		image = discord.File(io.BytesIO(image_data), filename = "heraldicon-arms.png")
 		embed.set_image(url = "attachment://heraldicon-arms.png")
 		embed.add_field(name = "Blazon", value = f"*{blazon}*", inline = True)
 		embed.set_footer(
@@ -151,7 +502,8 @@ async def heraldicon_options(session):
 	result = await utils.post_json(
 		session,
 		"https://2f1yb829vl.execute-api.eu-central-1.amazonaws.com/api",
-		{"call": "blazon-options"}
+		{"call": "blazon-options"},
+		ttl = OPTIONS_TTL
 	)
 	if "success" in result:
 		embed = embeds.DRAW.create(
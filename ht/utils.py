@@ -4,7 +4,7 @@ from logging import Formatter
 from textwrap import TextWrapper
 from datetime import timedelta
 from dateutil.tz import gettz
-from . import __version__, views
+from . import __version__, caches, views
 
 class MeldedCog(commands.Cog):
 	def __init_subclass__(self, *args, **kwargs):
@@ -28,18 +28,67 @@ class ModCog(MeldedCog, limit = False):
 		if await ctx.bot.is_owner(ctx.author):
 			return True
 		elif isinstance(ctx.channel, discord.abc.GuildChannel):
-			if self.is_mod(ctx.author.guild_permissions):
+			if self.is_mod(ctx.bot.perm_cache.get(ctx.guild, ctx.author.id)):
 				return True
 		else:
-			for guild in ctx.author.mutual_guilds:
-				perms = guild.get_member(ctx.author.id).guild_permissions
-				if self.is_mod(perms): return True
+			for guild in ctx.bot.perm_cache.mutual_guilds(ctx.author):
+				if self.is_mod(ctx.bot.perm_cache.get(guild, ctx.author.id)): return True
 
 		raise commands.MissingRole("admin")
 
 	@staticmethod
 	def is_mod(perms):
-		return perms.ban_members or perms.administrator
+		return perms is not None and (perms.ban_members or perms.administrator)
+
+class PermissionCache:
+	#resolved guild permissions, dropped whenever the roles or members they depend on change
+	def __init__(self, bot):
+		self.permissions = {}
+		self.mutual = {}
+
+		for event in ("on_member_join", "on_member_remove"):
+			bot.add_listener(self.forget_member, event)
+
+		for event in ("on_guild_role_delete", "on_guild_join", "on_guild_remove"):
+			bot.add_listener(self.forget_guild, event)
+
+		bot.add_listener(self.on_member_update)
+		bot.add_listener(self.on_guild_role_update)
+		bot.add_listener(self.on_guild_update)
+
+	def get(self, guild, user_id):
+		key = (guild.id, user_id)
+
+		if key not in self.permissions:
+			member = guild.get_member(user_id)
+			self.permissions[key] = member.guild_permissions if member else None
+
+		return self.permissions[key]
+
+	def mutual_guilds(self, user):
+		if user.id not in self.mutual:
+			self.mutual[user.id] = tuple(user.mutual_guilds)
+
+		return self.mutual[user.id]
+
+	async def forget_member(self, member):
+		self.permissions.pop((member.guild.id, member.id), None)
+		self.mutual.pop(member.id, None)
+
+	async def forget_guild(self, target):
+		#roles (or whole guilds) can affect anyone, so drop everything in the guild
+		guild_id = target.guild.id if isinstance(target, discord.Role) else target.id
+		self.permissions = {k: v for k, v in self.permissions.items() if k[0] != guild_id}
+		self.mutual.clear()
+
+	async def on_member_update(self, before, after):
+		if before.roles != after.roles: await self.forget_member(after)
+
+	async def on_guild_role_update(self, before, after):
+		if before.permissions != after.permissions: await self.forget_guild(after)
+
+	async def on_guild_update(self, before, after):
+		if before.owner_id != after.owner_id: await self.forget_guild(after)
 
 
 class NvFormatter(Formatter):
@@ -76,22 +125,39 @@ class CustomCommandError(commands.CommandError):
 
 USER_AGENT = f"{aiohttp.http.SERVER_SOFTWARE} Heraldtron/{__version__} (like Herald 3.0)" #for fun
 
-async def get_bytes(session, url, **kwargs):
-	async with session.get(url) as source:
-		image = await source.read(**kwargs)
-		return io.BytesIO(image)
+async def fetch(session, method, url, reader, ttl = None, data = None, coalesce = True, **kwargs):
+	#only the raw response is shared, and each caller parses its own copy so none see another's changes
+	download = lambda: perform(session, method, url, ttl, data)
+
+	if coalesce:
+		key = (id(session), method, url, ttl, json.dumps(data, sort_keys = True))
+		response = await caches.flights.run(key, download)
+	else:
+		response = await download()
+
+	return getattr(response, reader)(**kwargs)
 
-async def get_json(session, url, **kwargs):
-	async with session.get(url) as source:
-		return await source.json(**kwargs)
+async def perform(session, method, url, ttl, data):
+	headers = {"Accept": "application/json"} if data is not None else None
 
-async def post_json(session, url, data, **kwargs):
-	async with session.post(url, json=data, headers={"Accept": "application/json"}) as source:
-		return await source.json(**kwargs)
+	if ttl:
+		return await caches.responses.fetch(session, method, url, ttl, json = data, headers = headers)
 
-async def get_text(session, url, **kwargs):
-	async with session.get(url) as source:
-		return await source.text(**kwargs)
+	async with session.request(method, url, json = data, headers = headers) as source:
+		return caches.CachedResponse(source, await source.read(), 0)
+
+#endpoints that return something random each time should pass coalesce = False
+async def get_bytes(session, url, ttl = None, coalesce = True, **kwargs):
+	return io.BytesIO(await fetch(session, "GET", url, "read", ttl, coalesce = coalesce, **kwargs))
+
+async def get_json(session, url, ttl = None, coalesce = True, **kwargs):
+	return await fetch(session, "GET", url, "json", ttl, coalesce = coalesce, **kwargs)
+
+async def post_json(session, url, data, ttl = None, coalesce = True, **kwargs):
+	return await fetch(session, "POST", url, "json", ttl, data, coalesce, **kwargs)
+
+async def get_text(session, url, ttl = None, coalesce = True, **kwargs):
+	return await fetch(session, "GET", url, "text", ttl, coalesce = coalesce, **kwargs)
 
 async def get_channel(bot, channel):
 	return bot.get_channel(channel) or await bot.fetch_channel(channel)
@@ -130,7 +196,9 @@ async def check_is_owner(ctx):
 async def check_limited(ctx):
 	if not ctx.guild: return True
 
-	if ctx.bot.guild_cache[ctx.guild.id][1][2]:
+	record = ctx.bot.guild_cache.get(ctx.guild.id)
+
+	if record and record.limit_commands:
 		raise CustomCommandError(
 			"Command prohibited",
 			"This command is not allowed on this server."
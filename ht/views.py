@@ -21,36 +21,53 @@ def disable_dm_commands(func):
 	return wrapper
 
 class Navigator(ui.View):
-	def __init__(self, ctx, embeds):
+	#pages are either a sequence of embeds, or a callback that builds the page at an index
+	#extend, if given, is awaited when the end is reached and returns how many pages it added
+	def __init__(self, ctx, pages, count = None, extend = None):
 		super().__init__()
 
-		for i, embed in enumerate(embeds, start = 1):
-			embed.set_author(
-				name = f"{embed.author.name} ({i}/{len(embeds)})",
-				icon_url = embed.author.icon_url
-			)
-
 		self.ctx = ctx
 		self.index = 0
-		self.embeds = embeds
+		self.provider = pages if callable(pages) else pages.__getitem__
+		self.count = len(pages) if count is None else count
+		self.extend = extend
+		self.extending = False
+		self.pages = {}
 
 		self.add_nav("<:first:859371978612015136>", lambda: 0, disabled = True)
 		self.add_nav("<:prev:859371979035377694>", lambda: self.index - 1, disabled = True)
-		self.add_nav("<:random:859371979093442580>", lambda: random.randrange(0, len(self.embeds)), False)
+		self.add_nav("<:random:859371979093442580>", lambda: random.randrange(0, self.count), False)
 		self.add_nav("<:next:859371979026071582>", lambda: self.index + 1)
-		self.add_nav("<:last:859371979026464778>", lambda: len(self.embeds) - 1)
+		self.add_nav("<:last:859371979026464778>", lambda: self.count - 1)
+		self.update_buttons()
 
 	def add_nav(self, emoji, index, primary = True, **kwargs):
 		async def switch(interaction):
-			self.index = index()
+			if self.extending:
+				#a fetch is already running, and a second would load the same pages again
+				return await interaction.response.defer()
+
+			target = index()
 
-			for child in self.children[:2]:
-				child.disabled = self.index == 0
+			if target >= self.count and self.extend:
+				#fetching more can be slow, so acknowledge the press first
+				await interaction.response.defer()
+				self.extending = True
 
-			for child in self.children[-2:]:
-				child.disabled = self.index == len(self.embeds) - 1
+				try: added = await self.extend()
+				finally: self.extending = False
 
-			await interaction.response.edit_message(embed = self.embeds[self.index], view = self)
+				if added: self.count += added
+				else: self.extend = None
+
+			self.index = min(target, self.count - 1)
+			self.update_buttons()
+			embed = await self.get_page(self.index)
+
+			if interaction.response.is_done():
+				await interaction.edit_original_response(embed = embed, view = self)
+			else:
+				await interaction.response.edit_message(embed = embed, view = self)
 
 		style = discord.ButtonStyle.primary if primary else discord.ButtonStyle.secondary
 		button = ui.Button(emoji = emoji, style = style, **kwargs)
@@ -58,11 +75,35 @@ class Navigator(ui.View):
 
 		self.add_item(button)
 
+	def update_buttons(self):
+		for child in self.children[:2]:
+			child.disabled = self.index == 0
+
+		self.children[-2].disabled = self.index == self.count - 1 and not self.extend
+		self.children[-1].disabled = self.index == self.count - 1
+
+	async def get_page(self, index):
+		if index not in self.pages:
+			page = self.provider(index)
+			if asyncio.iscoroutine(page): page = await page
+
+			self.pages[index] = (page, page.author.name)
+
+		embed, name = self.pages[index]
+		total = f"{self.count}+" if self.extend else self.count
+		embed.set_author(name = f"{name} ({index + 1}/{total})", icon_url = embed.author.icon_url)
+
+		return embed
+
 	async def run(self):
-		self.message = await self.ctx.send(embed = self.embeds[0], view = self)
+		self.message = await self.ctx.send(embed = await self.get_page(0), view = self)
 
 	async def on_timeout(self):
-		await self.message.edit(embed = self.embeds[self.index], view = None)
+		await self.message.edit(embed = await self.get_page(self.index), view = None)
+
+		#nothing can be navigated to anymore, so let the pages be collected
+		self.pages.clear()
+		self.provider = self.extend = None
 
 class HelpSwitcher(ui.View):
 	def __init__(self, embeds):